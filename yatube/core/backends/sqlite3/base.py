@@ -0,0 +1,27 @@
+"""SQLite, настроенный для одновременной работы нескольких соединений.
+
+С журналом отката пишущая транзакция блокирует читателей, а второй
+писатель получает «database is locked». В режиме WAL читатели не ждут
+писателя, а busy_timeout заставляет писателей ждать друг друга, а не
+падать. synchronous=NORMAL в режиме WAL не грозит целостности базы: при
+сбое питания теряются только последние транзакции.
+
+Ожидание не спасает транзакцию, которая начала с чтения и только потом
+пишет (так устроены delete() и save() Django): SQLite не может повысить
+её блокировку и сразу отвечает ошибкой. Поэтому транзакции начинаются
+с BEGIN IMMEDIATE и берут блокировку записи сразу, ожидая её по
+busy_timeout.
+"""
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {settings.SQLITE_TRANSACTION_MODE}')
@@ -0,0 +1,226 @@
+"""Двухуровневый кэш: LRU в памяти процесса перед общим кэшем.
+
+Общий уровень (OPTIONS['SHARED'] — алиас из CACHES: файлы, memcached и
+т. п.) видят все процессы WSGI-сервера, поэтому запись или удаление в
+одном процессе сразу видны остальным. Локальный уровень держит копии
+только тех ключей, что начинаются с OPTIONS['LOCAL_PREFIXES']. Это
+должны быть версионированные ключи, значение которых не меняется:
+карточка с отпечатком содержимого в ключе, страница определённого
+поколения. Устаревшую версию никто не перезаписывает, её просто
+перестают запрашивать, поэтому рассылать инвалидацию по процессам не
+нужно. Сами счётчики версий и блокировки всегда читаются из общего кэша.
+
+Значения, которые в pickle занимают не меньше
+OPTIONS['COMPRESS_MIN_BYTES'], уходят в общий кэш сжатыми zlib.
+
+CacheHandler создаёт экземпляр бэкенда на каждый поток, поэтому, как у
+LocMemCache, локальный уровень хранится в модуле по LOCATION кэша и
+общий для всех потоков процесса.
+
+AtomicFileBasedCache — файловый кэш для общего уровня, у которого add
+атомарен и между процессами: на нём держатся блокировки пересчёта
+страниц (posts.cache).
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+
+from . import metrics
+
+_MISSING = object()
+
+# Локальные уровни по LOCATION кэша: ключ -> (когда истекает, pickle
+# значения); копия в pickle, чтобы запросы не делили один изменяемый
+# объект
+_locals = {}
+_locks = {}
+
+
+class AtomicFileBasedCache(FileBasedCache):
+    """FileBasedCache, у которого add атомарен.
+
+    У FileBasedCache add — это has_key и затем set: два процесса могут оба
+    не найти ключ и оба его «добавить». Здесь значение пишется во
+    временный файл, а ставится на место жёсткой ссылкой: os.link не
+    перезаписывает существующий файл, поэтому из одновременных add
+    удаётся ровно один. Просроченный файл has_key удаляет заранее; если
+    два процесса одновременно застали один просроченный файл, выиграть
+    могут оба — для блокировки, которая лишь сдерживает пересчёт, это
+    допустимо.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.has_key(key, version):  # noqa: W601
+            return False
+        self._createdir()
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as file:
+                self._write_content(file, timeout, value)
+            os.link(tmp_path, self._key_to_file(key, version))
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+
+class Compressed(bytes):
+    """Значение, сжатое для общего кэша: zlib поверх pickle."""
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 500)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self.compress_min_bytes = options.get('COMPRESS_MIN_BYTES')
+        self.local = _locals.setdefault(location, OrderedDict())
+        self.lock = _locks.setdefault(location, threading.Lock())
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def is_local(self, key):
+        return key.startswith(self.local_prefixes)
+
+    def local_get(self, key, version):
+        key = self.make_key(key, version)
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self.local[key]
+                return None
+            self.local.move_to_end(key)
+            return data
+
+    def local_set(self, key, data, timeout, version):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None or timeout > self.local_timeout:
+            timeout = self.local_timeout
+        key = self.make_key(key, version)
+        with self.lock:
+            self.local[key] = (time.monotonic() + timeout, data)
+            self.local.move_to_end(key)
+            while len(self.local) > self.local_max_entries:
+                self.local.popitem(last=False)
+
+    def local_delete(self, key, version):
+        with self.lock:
+            self.local.pop(self.make_key(key, version), None)
+
+    def pack(self, value, data=None):
+        """Значение для общего кэша."""
+        if self.compress_min_bytes is None:
+            return value
+        if data is None:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) < self.compress_min_bytes:
+            return value
+        return Compressed(zlib.compress(data))
+
+    def unpack(self, value):
+        """Значение из общего кэша и его pickle, если он уже есть."""
+        if isinstance(value, Compressed):
+            data = zlib.decompress(value)
+            return pickle.loads(data), data
+        return value, None
+
+    def remember(self, key, value, data, version):
+        if data is None:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.local_set(key, data, None, version)
+
+    def get(self, key, default=None, version=None):
+        local = self.is_local(key)
+        if local:
+            data = self.local_get(key, version)
+            metrics.cache_result('local', 'miss' if data is None else 'hit')
+            if data is not None:
+                return pickle.loads(data)
+        value = self.shared.get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        value, data = self.unpack(value)
+        if local:
+            self.remember(key, value, data, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        rest = []
+        for key in keys:
+            data = self.local_get(key, version) if self.is_local(key) else None
+            if data is None:
+                rest.append(key)
+            else:
+                found[key] = pickle.loads(data)
+        local_keys = sum(self.is_local(key) for key in keys)
+        metrics.cache_result('local', 'hit', len(found))
+        metrics.cache_result('local', 'miss', local_keys - len(found))
+        for key, value in self.shared.get_many(rest, version).items():
+            value, data = self.unpack(value)
+            if self.is_local(key):
+                self.remember(key, value, data, version)
+            found[key] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        data = None
+        if self.is_local(key):
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            self.local_set(key, data, timeout, version)
+        self.shared.set(key, self.pack(value, data), timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        packed = {}
+        for key, value in data.items():
+            pickled = None
+            if self.is_local(key):
+                pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                self.local_set(key, pickled, timeout, version)
+            packed[key] = self.pack(value, pickled)
+        return self.shared.set_many(packed, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local_delete(key, version)
+        return self.shared.add(key, self.pack(value), timeout, version)
+
+    def delete(self, key, version=None):
+        self.local_delete(key, version)
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.local_delete(key, version)
+        self.shared.delete_many(keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local_delete(key, version)
+        return self.shared.incr(key, delta, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def clear(self):
+        """Очищает общий кэш и локальный уровень этого процесса."""
+        with self.lock:
+            self.local.clear()
+        self.shared.clear()
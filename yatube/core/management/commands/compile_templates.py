@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.precompile import compile_all
+
+
+class Command(BaseCommand):
+    help = ('Компилирует все шаблоны проекта и шаблоны, на которые они '
+            'ссылаются; падает, если хоть один не компилируется')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        compiled, errors = compile_all()
+        elapsed = time.perf_counter() - start
+        for name, referrer, error in errors:
+            source = f' (из {referrer})' if referrer else ''
+            self.stderr.write(f'{name}{source}: {error}')
+        if errors:
+            raise CommandError(f'Не скомпилировано шаблонов: {len(errors)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Скомпилировано шаблонов: {len(compiled)} '
+            f'за {elapsed * 1000:.0f} мс'))
@@ -0,0 +1,361 @@
+"""Метрики в текстовом формате Prometheus.
+
+Счётчики и гистограммы копятся в памяти процесса: запись — это
+сложение под коротким замком, без обращений к диску и сети. Если задан
+METRICS_DIR, каждый процесс раз в METRICS_FLUSH_INTERVAL секунд (и при
+каждом скрейпе) сбрасывает свой снимок в файл <pid>.json, а /metrics
+суммирует снимки всех процессов — так под многопроцессным WSGI-сервером
+любой воркер отдаёт общую картину. Снимки завершившихся процессов
+переносятся в накопленный итог aggregate.json, чтобы счётчики не
+откатывались назад, а их файлы удаляются: при выходе процесса и при
+первом сбросе каждого нового (в том числе файл прежнего процесса с тем
+же PID). Каталог должен быть общим для процессов одной машины: живость
+процесса проверяется по PID. METRICS_DIR работает только в POSIX: файлы
+запираются через fcntl.
+
+/metrics выключен по умолчанию (METRICS_ENABLED) и отвечает только
+адресам из METRICS_ALLOWED_IPS.
+
+Что собирается:
+- время ответа представлений posts, users и about (гистограмма) и
+  число ответов по статусам;
+- число SQL-запросов по представлениям;
+- созданные посты, комментарии и подписки (posts.signals);
+- попадания и промахи кэша страниц (posts.cache) и кэша карточек
+  (posts.cards), а также доля попаданий по каждому.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Границы корзин гистограммы времени ответа, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Представления из других приложений (админка и т. п.) сводятся в одну
+# метку, чтобы не плодить ряды
+NAMESPACES = ('posts', 'users', 'about')
+OTHER_VIEW = 'other'
+METRICS = {
+    'yatube_http_request_duration_seconds': (
+        'histogram', 'Время ответа представления'),
+    'yatube_http_responses_total': (
+        'counter', 'Ответы по представлениям и статусам'),
+    'yatube_db_queries_total': (
+        'counter', 'SQL-запросы по представлениям'),
+    'yatube_objects_created_total': (
+        'counter', 'Созданные посты, комментарии и подписки'),
+    'yatube_cache_requests_total': (
+        'counter', 'Обращения к слоям кэша по результату'),
+    'yatube_cache_hit_ratio': (
+        'gauge', 'Доля попаданий в слой кэша'),
+}
+# Итог завершившихся процессов и замок каталога METRICS_DIR
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = '.lock'
+
+
+@contextmanager
+def locked(directory, exclusive):
+    """Замок каталога снимков: исключительный на перенос и запись,
+    разделяемый на чтение, чтобы скрейп не видел снимок и в файле, и в
+    итоге.
+
+    fcntl есть только в POSIX, поэтому импортируется здесь: счёт в
+    памяти процесса без METRICS_DIR работает на любой платформе.
+    """
+    import fcntl
+
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_snapshot(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        # Файл мог исчезнуть или оказаться недописанным
+        return None
+
+
+def write_snapshot(path, snapshot):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump(snapshot, file, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fold(directory, paths):
+    """Переносит снимки paths в накопленный итог и удаляет их файлы.
+
+    Вызывается под исключительным замком.
+    """
+    aggregate = os.path.join(directory, AGGREGATE_FILE)
+    parts = [read_snapshot(path) for path in [aggregate, *paths]]
+    write_snapshot(aggregate, as_snapshot(
+        *merge(part for part in parts if part is not None)))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def fold_dead(directory, own_path):
+    """Переносит в итог снимки завершившихся процессов. Свой файл к
+    первому сбросу процесса может остаться только от прежнего процесса с
+    тем же PID."""
+    dead = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        name = os.path.basename(path)[:-len('.json')]
+        if path == own_path or name.isdigit() and not is_alive(int(name)):
+            dead.append(path)
+    if dead:
+        fold(directory, dead)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.pid = os.getpid()
+            self.flushed = time.monotonic()
+            self.counters = defaultdict(float)
+            # (имя, метки) -> [число в каждой корзине..., сумма]
+            self.histograms = {}
+            # Снимки завершившихся процессов переносятся в итог при
+            # первом сбросе
+            self.folded = False
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(BUCKETS, value)
+        with self.lock:
+            series = self.histograms.get(key)
+            if series is None:
+                series = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return as_snapshot(self.counters, self.histograms)
+
+    def after_fork(self):
+        """Процесс, унаследовавший реестр от родителя, начинает с нуля."""
+        if self.pid != os.getpid():
+            self.reset()
+
+    def flush(self, force=False):
+        """Пишет снимок в METRICS_DIR, если пора или если force."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.pid}.json')
+        with locked(directory, exclusive=True):
+            if not self.folded:
+                self.folded = True
+                fold_dead(directory, path)
+            write_snapshot(path, self.snapshot())
+
+    def retire(self):
+        """При выходе процесса переносит его снимок в итог."""
+        directory = settings.METRICS_DIR
+        if not directory or self.pid != os.getpid():
+            return
+        path = os.path.join(directory, f'{self.pid}.json')
+        os.makedirs(directory, exist_ok=True)
+        with locked(directory, exclusive=True):
+            write_snapshot(path, self.snapshot())
+            fold(directory, [path])
+
+
+registry = Registry()
+atexit.register(registry.retire)
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, labels, value)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, labels, value)
+
+
+def cache_result(layer, result, count=1):
+    """Учитывает обращения к слою кэша: result — hit, stale или miss."""
+    if count:
+        registry.inc('yatube_cache_requests_total',
+                     {'layer': layer, 'result': result}, count)
+
+
+def snapshots():
+    """Снимки всех процессов: из METRICS_DIR или только свой."""
+    if not settings.METRICS_DIR:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    with locked(settings.METRICS_DIR, exclusive=False):
+        result = [read_snapshot(path) for path in glob.glob(
+            os.path.join(settings.METRICS_DIR, '*.json'))]
+    return [snapshot for snapshot in result if snapshot is not None]
+
+
+def merge(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(sorted(labels.items()))] += value
+        for name, labels, series in snapshot['histograms']:
+            key = name, tuple(sorted(labels.items()))
+            total = histograms.setdefault(key, [0] * len(series))
+            for index, value in enumerate(series):
+                total[index] += value
+    return counters, histograms
+
+
+def as_snapshot(counters, histograms):
+    """Снимок в формате файла из словарей merge() или реестра."""
+    return {
+        'counters': [[name, dict(labels), value] for
+                     (name, labels), value in counters.items()],
+        'histograms': [[name, dict(labels), list(series)] for
+                       (name, labels), series in histograms.items()],
+    }
+
+
+def hit_ratios(counters):
+    requests = defaultdict(lambda: [0.0, 0.0])
+    for (name, labels), value in counters.items():
+        if name == 'yatube_cache_requests_total':
+            labels = dict(labels)
+            requests[labels['layer']][1] += value
+            if labels['result'] == 'hit':
+                requests[labels['layer']][0] += value
+    return {(('layer', layer),): hits / total
+            for layer, (hits, total) in requests.items() if total}
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+         .replace('\n', r'\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"'
+                          for name, value in escaped) + '}'
+
+
+def _number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    counters, histograms = merge(snapshots())
+    series = defaultdict(list)
+    for (name, labels), value in sorted(counters.items()):
+        series[name].append(f'{name}{_labels(labels)} {_number(value)}')
+    for labels, ratio in sorted(hit_ratios(counters).items()):
+        series['yatube_cache_hit_ratio'].append(
+            f'yatube_cache_hit_ratio{_labels(labels)} {ratio:.6f}')
+    for (name, labels), values in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), values[:-1]):
+            cumulative += count
+            le = bound if bound == '+Inf' else repr(bound)
+            series[name].append(
+                f'{name}_bucket{_labels(labels + (("le", le),))} '
+                f'{cumulative}')
+        series[name].append(
+            f'{name}_sum{_labels(labels)} {values[-1]!r}')
+        series[name].append(f'{name}_count{_labels(labels)} {cumulative}')
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        if series[name]:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(series[name])
+    return '\n'.join(lines) + '\n'
+
+
+def view_label(request):
+    match = request.resolver_match
+    if match is None or match.namespace not in NAMESPACES:
+        return OTHER_VIEW
+    return match.view_name
+
+
+class QueryCounter:
+    """Обёртка connection.execute_wrapper, только считает запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registry.after_fork()
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        view = view_label(request)
+        observe('yatube_http_request_duration_seconds', elapsed, view=view)
+        inc('yatube_http_responses_total', view=view,
+            status=str(response.status_code))
+        inc('yatube_db_queries_total', queries.count, view=view)
+        registry.flush()
+        return response
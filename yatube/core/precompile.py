@@ -0,0 +1,74 @@
+"""Предкомпиляция шаблонов.
+
+С кэширующим загрузчиком (без DEBUG, см. TEMPLATE_LOADERS) шаблон
+разбирается, когда он впервые понадобился, и за разбор платит первый
+запрос. compile_all() заранее разбирает все шаблоны из DIRS движков
+Django и те, на которые они ссылаются в extends и include, — так кэш
+загрузчика прогрет до первого запроса. Заодно находятся ошибки
+синтаксиса и ссылки на несуществующие шаблоны.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.loader_tags import ExtendsNode, IncludeNode
+
+logger = logging.getLogger(__name__)
+
+
+def template_names(directory):
+    """Имена .html-шаблонов в каталоге, как их передают get_template."""
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if file.endswith('.html'):
+                path = os.path.relpath(os.path.join(root, file), directory)
+                yield path.replace(os.sep, '/')
+
+
+def referenced(template):
+    """Шаблоны, заданные в extends и include строкой."""
+    nodelist = template.template.nodelist
+    expressions = [node.parent_name for node in
+                   nodelist.get_nodes_by_type(ExtendsNode)]
+    expressions += [node.template for node in
+                    nodelist.get_nodes_by_type(IncludeNode)]
+    for expression in expressions:
+        if isinstance(expression.var, str) and not expression.filters:
+            yield str(expression.var)
+
+
+def compile_all():
+    """Компилирует шаблоны, возвращает список имён и список ошибок
+    (имя, откуда на него сослались, исключение)."""
+    compiled, errors = [], []
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        queue = [(name, None) for directory in engine.engine.dirs
+                 for name in template_names(directory)]
+        seen = set()
+        while queue:
+            name, referrer = queue.pop(0)
+            if name in seen:
+                continue
+            seen.add(name)
+            try:
+                template = engine.get_template(name)
+            except (TemplateDoesNotExist, TemplateSyntaxError) as error:
+                errors.append((name, referrer, error))
+                continue
+            compiled.append(name)
+            queue.extend((child, name) for child in referenced(template))
+    return compiled, errors
+
+
+def warm():
+    """Прогревает кэш шаблонов при старте процесса без DEBUG."""
+    if settings.DEBUG:
+        return
+    _, errors = compile_all()
+    for name, referrer, error in errors:
+        logger.error('Шаблон %s (из %s) не скомпилирован: %s',
+                     name, referrer or 'DIRS', error)
@@ -0,0 +1,236 @@
+"""Профилирование запросов: время ответа, SQL, шаблоны и кэш.
+
+ProfilingMiddleware включается настройкой REQUEST_PROFILING. Для
+каждого запроса она собирает:
+- общее время ответа;
+- число и суммарное время SQL-запросов, повторы одного и того же SQL
+  с разными параметрами (признак N+1);
+- время рендеринга шаблонов (вложенные include не считаются дважды);
+- попадания и промахи кэша.
+
+Итоги запроса уходят в заголовок Server-Timing и копятся по имени
+представления (request.resolver_match.view_name) в памяти процесса;
+сводку отдаёт core.views.profiling_stats.
+"""
+import functools
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+_installed = False
+_MISSING = object()
+# Суммируемые показатели; кроме них по представлению хранится максимум
+# времени ответа
+TOTALS = ('requests', 'total_ms', 'sql_count', 'sql_ms', 'duplicates',
+          'template_ms', 'cache_hits', 'cache_misses')
+_stats = defaultdict(Counter)
+_max_ms = defaultdict(float)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql = Counter()
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # get_many у многих бэкендов сделан через get: такие чтения
+        # считает обёртка get_many
+        self.in_get_many = False
+
+    @property
+    def sql_count(self):
+        return sum(self.sql.values())
+
+    @property
+    def duplicates(self):
+        """Сколько запросов повторили уже выполненный SQL."""
+        return sum(count - 1 for count in self.sql.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка connection.execute_wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - start) * 1000
+            self.sql[sql] += 1
+
+    def suspects(self):
+        """SQL, повторённый не меньше порога раз за запрос."""
+        threshold = settings.REQUEST_PROFILING_DUPLICATES
+        return [(sql, count) for sql, count in self.sql.most_common()
+                if count >= threshold]
+
+    def summary(self):
+        return {
+            'total_ms': (time.perf_counter() - self.start) * 1000,
+            'sql_count': self.sql_count,
+            'sql_ms': self.sql_ms,
+            'duplicates': self.duplicates,
+            'template_ms': self.template_ms,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def current():
+    """Профиль текущего запроса или None."""
+    return getattr(_local, 'profile', None)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context):
+        profile = current()
+        if profile is None:
+            return render(self, context)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_ms += (time.perf_counter() - start) * 1000
+    return wrapper
+
+
+def _counted_get(get):
+    @functools.wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, _MISSING, version)
+        profile = current()
+        if profile is not None and not profile.in_get_many:
+            if value is _MISSING:
+                profile.cache_misses += 1
+            else:
+                profile.cache_hits += 1
+        return default if value is _MISSING else value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @functools.wraps(get_many)
+    def wrapper(self, keys, version=None):
+        profile = current()
+        if profile is None or profile.in_get_many:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        profile.in_get_many = True
+        try:
+            found = get_many(self, keys, version)
+        finally:
+            profile.in_get_many = False
+        profile.cache_hits += len(found)
+        profile.cache_misses += len(keys) - len(found)
+        return found
+    return wrapper
+
+
+def install():
+    """Подменяет Template.render и чтение из кэшей на замеряющие версии.
+
+    Вне профилируемого запроса обёртки сразу зовут оригинал.
+    """
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        Template.render = _timed_render(Template.render)
+        # Общий уровень двухуровневого кэша (core.cache) читается через
+        # него, и такие чтения уже посчитаны
+        shared = {params.get('OPTIONS', {}).get('SHARED')
+                  for params in settings.CACHES.values()
+                  if params['BACKEND'] == 'core.cache.TieredCache'}
+        patched = set()
+        for alias in settings.CACHES:
+            backend = type(caches[alias])
+            if alias not in shared and backend not in patched:
+                backend.get = _counted_get(backend.get)
+                backend.get_many = _counted_get_many(backend.get_many)
+                patched.add(backend)
+        _installed = True
+
+
+def record(view_name, summary):
+    with _lock:
+        totals = _stats[view_name]
+        totals['requests'] += 1
+        for name, value in summary.items():
+            totals[name] += value
+        _max_ms[view_name] = max(_max_ms[view_name], summary['total_ms'])
+
+
+def stats():
+    """Сводка по представлениям: суммы и средние на запрос."""
+    with _lock:
+        result = {}
+        for view_name, totals in sorted(_stats.items()):
+            requests = totals['requests']
+            row = {'requests': requests,
+                   'max_ms': round(_max_ms[view_name], 2)}
+            for name in TOTALS[1:]:
+                row[f'avg_{name}'] = round(totals[name] / requests, 2)
+            result[view_name] = row
+        return result
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _max_ms.clear()
+
+
+def server_timing(summary):
+    """Значение заголовка Server-Timing."""
+    return ', '.join((
+        f'total;dur={summary["total_ms"]:.1f}',
+        f'sql;dur={summary["sql_ms"]:.1f};'
+        f'desc="{summary["sql_count"]} queries / '
+        f'{summary["duplicates"]} duplicates"',
+        f'tpl;dur={summary["template_ms"]:.1f}',
+        f'cache;desc="{summary["cache_hits"]} hits / '
+        f'{summary["cache_misses"]} misses"',
+    ))
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = _local.profile = RequestProfile()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        summary = profile.summary()
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        record(view_name, summary)
+        response['Server-Timing'] = server_timing(summary)
+        for sql, count in profile.suspects():
+            logger.warning('%s: запрос выполнен %d раз за ответ: %s',
+                           view_name, count, sql)
+        return response
@@ -0,0 +1,82 @@
+"""Чтение лент с реплик базы данных.
+
+ReplicaRoutingMiddleware решает, можно ли этому запросу читать с
+реплики: можно, если представление — одна из лент (REPLICA_READ_VIEWS) и
+пользователь недавно ничего не записывал. ReplicaRouter (DATABASE_ROUTERS)
+исполняет решение: чтение уходит на случайную реплику из
+DATABASE_REPLICAS, запись и чтение внутри транзакции — на основную базу.
+
+Реплика отстаёт от основной базы, поэтому после своей записи
+пользователь REPLICA_PIN_SECONDS читает только с основной: момент,
+до которого действует закрепление, хранится в cookie, чтобы не трогать
+сессию.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_pin'
+
+_state = threading.local()
+
+
+def replica_allowed():
+    return getattr(_state, 'replica', None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = replica_allowed()
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if hasattr(_state, 'replica'):
+            _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы, связи между ними допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica = None
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            wrote = _state.wrote
+        finally:
+            del _state.replica, _state.wrote
+        if wrote:
+            pin_seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + pin_seconds)),
+                max_age=pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = settings.DATABASE_REPLICAS
+        if (replicas and request.method in ('GET', 'HEAD')
+                and request.resolver_match.view_name
+                in settings.REPLICA_READ_VIEWS
+                and not is_pinned(request)):
+            _state.replica = random.choice(replicas)
@@ -1,6 +1,37 @@
+import io
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import (DEFAULT_DB_ALIAS, OperationalError, connection,
+                       connections)
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import metrics, profiling, replicas
+from core.cache import Compressed, TieredCache
+from core.precompile import compile_all
+from posts.cache import GENERATION_KEY, bump_generation, get_generation
+from posts.models import Comment, Post
+from posts.tests.bench import (SEED, env_int, load_baseline, percentile,
+                               seed_data, timing, write_report)
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -11,3 +42,623 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(REQUEST_PROFILING=True)
+class ProfilingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(
+            username='staff', is_staff=True)
+        cls.author = User.objects.create_user(username='profiled')
+        Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        profiling.reset()
+        self.client = Client()
+
+    def timing(self, response):
+        """Server-Timing в виде словаря метрика -> параметры"""
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = params
+        return metrics
+
+    def test_server_timing(self):
+        """Ответ несёт время, SQL, шаблоны и кэш в Server-Timing"""
+        metrics = self.timing(self.client.get(reverse('posts:index')))
+        self.assertEqual(set(metrics), {'total', 'sql', 'tpl', 'cache'})
+        self.assertRegex(metrics['sql'][1], r'desc="[1-9]\d* queries')
+        self.assertNotEqual(metrics['tpl'][0], 'dur=0.0')
+
+    def test_stats_by_view(self):
+        """Сводка копится по имени представления, кэш учитывается"""
+        for _ in range(2):
+            self.client.get(reverse('posts:index'))
+        row = profiling.stats()['posts:index']
+        self.assertEqual(row['requests'], 2)
+        self.assertGreater(row['avg_sql_count'], 0)
+        self.assertGreater(row['avg_cache_hits'], 0)
+        self.assertGreater(row['avg_cache_misses'], 0)
+
+    def test_duplicates_counted(self):
+        """Один и тот же SQL с разными параметрами считается повтором"""
+        profile = profiling.RequestProfile()
+        with connection.execute_wrapper(profile):
+            for pk in range(3):
+                Post.objects.filter(pk=pk).exists()
+        self.assertEqual(profile.duplicates, 2)
+        self.assertEqual(len(profile.suspects()), 1)
+
+    def test_stats_endpoint_staff_only(self):
+        """Сводку видит только персонал, POST её обнуляет"""
+        url = reverse('core:profiling')
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(self.client.get(url).status_code,
+                         HTTPStatus.FOUND)
+        self.client.force_login(self.staff)
+        data = self.client.get(url).json()
+        self.assertIn('posts:index', data['views'])
+        data = self.client.post(url).json()
+        self.assertEqual(list(data['views']), [])
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled(self):
+        """Без настройки middleware не подключается"""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='metrics_author')
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = Client()
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_view_latency_and_queries(self):
+        """Время ответа и SQL учитываются по представлениям"""
+        for _ in range(2):
+            self.client.get(reverse('posts:index'))
+        self.client.get(reverse('about:author'))
+        text = self.scrape()
+        self.assertIn('# TYPE yatube_http_request_duration_seconds '
+                      'histogram', text)
+        self.assertIn('yatube_http_request_duration_seconds_bucket'
+                      '{view="posts:index",le="+Inf"} 2', text)
+        self.assertIn('yatube_http_request_duration_seconds_count'
+                      '{view="about:author"} 1', text)
+        self.assertIn('yatube_http_responses_total'
+                      '{status="200",view="posts:index"} 2', text)
+        self.assertRegex(
+            text, r'yatube_db_queries_total\{view="posts:index"\} [1-9]')
+
+    def test_other_views_grouped(self):
+        """Представления вне posts, users и about не плодят ряды"""
+        self.client.get('/admin/login/')
+        self.assertIn('yatube_http_request_duration_seconds_count'
+                      '{view="other"} 1', self.scrape())
+
+    def test_created_objects_and_cache(self):
+        """Созданные объекты и попадания в кэш страниц считаются"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.author, text='Да')
+        for _ in range(2):
+            self.client.get(reverse('posts:index'))
+        text = self.scrape()
+        self.assertIn(
+            'yatube_objects_created_total{model="post"} 1', text)
+        self.assertIn(
+            'yatube_objects_created_total{model="comment"} 1', text)
+        self.assertIn('yatube_cache_requests_total'
+                      '{layer="page",result="hit"} 1', text)
+        self.assertIn('yatube_cache_requests_total'
+                      '{layer="card",result="miss"} 1', text)
+        self.assertIn('yatube_cache_hit_ratio{layer="page"} 0.500000', text)
+
+    def test_processes_merged(self):
+        """Снимки других процессов из METRICS_DIR суммируются"""
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(METRICS_DIR=directory):
+            other = metrics.Registry()
+            other.pid = 'other'
+            other.inc('yatube_objects_created_total', {'model': 'post'}, 3)
+            other.flush(force=True)
+            Post.objects.create(author=self.author, text='Пост')
+            text = self.scrape()
+        self.assertIn(
+            'yatube_objects_created_total{model="post"} 4', text)
+
+    def test_dead_processes_folded(self):
+        """Снимки завершившихся процессов и прежнего процесса с тем же
+        PID переходят в итог, а их файлы удаляются"""
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        for pid in (dead.pid, os.getpid()):
+            metrics.write_snapshot(
+                os.path.join(directory, f'{pid}.json'),
+                {'counters': [['yatube_objects_created_total',
+                               {'model': 'post'}, 2]],
+                 'histograms': []})
+        with override_settings(METRICS_DIR=directory):
+            Post.objects.create(author=self.author, text='Пост')
+            self.assertIn(
+                'yatube_objects_created_total{model="post"} 5',
+                self.scrape())
+            self.assertEqual(
+                sorted(name for name in os.listdir(directory)
+                       if name.endswith('.json')),
+                [f'{os.getpid()}.json', metrics.AGGREGATE_FILE])
+            metrics.registry.retire()
+            self.assertEqual(
+                [name for name in os.listdir(directory)
+                 if name.endswith('.json')],
+                [metrics.AGGREGATE_FILE])
+            counters, _ = metrics.merge([metrics.read_snapshot(
+                os.path.join(directory, metrics.AGGREGATE_FILE))])
+        self.assertEqual(
+            counters['yatube_objects_created_total', (('model', 'post'),)],
+            5)
+
+    def test_counting_without_fcntl(self):
+        """Без METRICS_DIR сайт импортируется и считает метрики и там,
+        где нет fcntl"""
+        code = (
+            "import sys; sys.modules['fcntl'] = None\n"
+            "import django; django.setup()\n"
+            "from django.urls import reverse; reverse('posts:index')\n"
+            "from core import metrics\n"
+            "metrics.inc('yatube_objects_created_total', model='post')\n"
+            "print(metrics.render())\n"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='yatube.settings'),
+            capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('yatube_objects_created_total{model="post"} 1',
+                      result.stdout)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.client.get('/metrics').status_code,
+                         HTTPStatus.NOT_FOUND)
+
+    def test_other_addresses_forbidden(self):
+        """Метрики отдаются только адресам из METRICS_ALLOWED_IPS"""
+        self.assertEqual(
+            self.client.get('/metrics', REMOTE_ADDR='192.0.2.1').status_code,
+            HTTPStatus.FORBIDDEN)
+
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """«Реплика» — второе соединение с тестовой базой, поэтому данные
+    должны быть закоммичены: отсюда TransactionTestCase."""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        replica = dict(connections['default'].settings_dict)
+        cls.replica_settings = override_settings(
+            DATABASES={**settings.DATABASES, 'replica': replica},
+            DATABASE_REPLICAS=['replica'],
+        )
+        cls.replica_settings.enable()
+        # Алиасы соединений читаются из настроек один раз при старте
+        connections.databases['replica'] = replica
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        cls.replica_settings.disable()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='replicated')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.client = Client()
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(primary), len(replica)
+
+    def test_feeds_read_from_replica(self):
+        """Ленты читаются с реплики, остальные страницы — с основной"""
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', args=[self.author.username])):
+            with self.subTest(url=url):
+                primary, replica = self.get(url)
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+        primary, replica = self.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_pinned_after_write(self):
+        """После записи пользователь читает ленты с основной базы"""
+        self.client.force_login(self.author)
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        primary, replica = self.get(reverse('posts:index'))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_reads_without_pin(self):
+        """Чтение не закрепляет пользователя за основной базой"""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_disabled(self):
+        """Без реплик всё читается с основной базы"""
+        self.assertEqual(self.get(reverse('posts:index'))[1], 0)
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.params = {
+            'BACKEND': 'core.cache.TieredCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_PREFIXES': ('fixed:',),
+                'LOCAL_MAX_ENTRIES': 2,
+                'COMPRESS_MIN_BYTES': 1024,
+            },
+        }
+        settings_override = override_settings(CACHES={
+            'default': self.params,
+            'shared': {
+                'BACKEND': 'core.cache.AtomicFileBasedCache',
+                'LOCATION': directory,
+            },
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def other_process(self):
+        """Такой же кэш с пустым локальным уровнем."""
+        return TieredCache(None, self.params)
+
+    def test_shared_between_processes(self):
+        """Запись и удаление видны другим процессам"""
+        other = self.other_process()
+        self.cache.set('mutable', 1)
+        self.cache.set('fixed:card', 'карточка')
+        self.assertEqual(other.get('mutable'), 1)
+        self.assertEqual(other.get('fixed:card'), 'карточка')
+        self.cache.set('mutable', 2)
+        self.assertEqual(other.get('mutable'), 2)
+        self.cache.delete('mutable')
+        self.assertIsNone(other.get('mutable'))
+
+    def test_add_atomic_between_processes(self):
+        """Из одновременных add ключ получает только один, даже если оба
+        успели не найти его"""
+        shared = caches['shared']
+        with mock.patch.object(type(shared), 'has_key', return_value=False):
+            self.assertTrue(self.cache.add('lock', 1))
+            self.assertFalse(self.other_process().add('lock', 2))
+        self.assertEqual(self.cache.get('lock'), 1)
+        self.cache.delete('lock')
+        self.assertTrue(self.other_process().add('lock', 2))
+
+    def test_local_tier_shared_between_threads(self):
+        """Потоки процесса читают один локальный уровень"""
+        self.cache.set('fixed:1', 'один')
+        caches['shared'].clear()
+        found = []
+        thread = threading.Thread(
+            target=lambda: found.append(caches['default'].get('fixed:1')))
+        thread.start()
+        thread.join()
+        self.assertEqual(found, ['один'])
+
+    def test_local_tier(self):
+        """Неизменяемые ключи читаются из памяти процесса, LRU
+        ограничен"""
+        self.cache.set('fixed:1', 'один')
+        self.cache.set('mutable', 'общий')
+        caches['shared'].clear()
+        self.assertEqual(self.cache.get('fixed:1'), 'один')
+        self.assertIsNone(self.cache.get('mutable'))
+        self.cache.set('fixed:2', 'два')
+        self.cache.set('fixed:3', 'три')
+        self.assertEqual(self.cache.get_many(['fixed:1', 'fixed:3']),
+                         {'fixed:3': 'три'})
+
+    def test_local_copies(self):
+        """Из локального уровня каждый раз приходит новая копия"""
+        self.cache.set('fixed:list', [1])
+        self.cache.get('fixed:list').append(2)
+        self.assertEqual(self.cache.get('fixed:list'), [1])
+
+    def test_large_values_compressed(self):
+        """Крупные значения лежат в общем кэше сжатыми"""
+        page = 'страница ' * 1000
+        self.cache.set('page', page)
+        self.cache.set('small', 'мало')
+        stored = caches['shared'].get('page')
+        self.assertIsInstance(stored, Compressed)
+        self.assertLess(len(stored), len(page))
+        self.assertEqual(caches['shared'].get('small'), 'мало')
+        self.assertEqual(self.other_process().get('page'), page)
+
+    def test_page_generation_shared(self):
+        """Смена поколения в одном процессе сбрасывает страницы во всех"""
+        generation = get_generation()
+        other = self.other_process()
+        self.assertEqual(other.get(GENERATION_KEY)[0], generation)
+        bump_generation()
+        self.assertNotEqual(other.get(GENERATION_KEY)[0], generation)
+
+
+class PrecompileTest(TestCase):
+    def make_templates(self, files):
+        directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        for name, content in files.items():
+            path = os.path.join(directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(content)
+        settings_override = override_settings(TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [directory],
+        }])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_project_templates_compile(self):
+        """Все шаблоны проекта компилируются"""
+        compiled, errors = compile_all()
+        self.assertEqual(errors, [])
+        for name in ('base.html', 'posts/index.html', 'include/header.html',
+                     'users/login.html', 'core/404.html'):
+            self.assertIn(name, compiled)
+
+    def test_errors_reported(self):
+        """Ошибки синтаксиса и ссылки на несуществующие шаблоны"""
+        self.make_templates({
+            'page.html': '{% extends "base.html" %}'
+                         '{% block body %}{% include "missing.html" %}'
+                         '{% endblock %}',
+            'base.html': '{% block body %}{% endblock %}',
+            'broken.html': '{% if %}',
+        })
+        compiled, errors = compile_all()
+        self.assertCountEqual(compiled, ['base.html', 'page.html'])
+        self.assertEqual(
+            [(name, referrer) for name, referrer, _ in errors],
+            [('broken.html', None), ('missing.html', 'page.html')])
+        with self.assertRaises(CommandError):
+            call_command('compile_templates', stderr=io.StringIO())
+
+
+# Поведение SQLite по умолчанию: журнал отката, отложенные транзакции
+# и ожидание блокировки, которое модуль sqlite3 задаёт сам
+DEFAULT_SQLITE = {
+    'SQLITE_PRAGMAS': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'SQLITE_TRANSACTION_MODE': 'DEFERRED',
+}
+
+
+@timing
+class ConcurrencyBenchmark(TransactionTestCase):
+    """Поток запросов из пула потоков: чтение лент и страниц постов
+    вперемешку с комментариями и новыми постами.
+
+    Тестовая база SQLite живёт в памяти, а блокировки проявляются только
+    у файла, поэтому каждый прогон идёт на копии базы во временном файле:
+    с настройками SQLite по умолчанию и с настройками проекта.
+    """
+    databases = {'default'}
+    write_share = 0.2
+
+    def setUp(self):
+        self.volumes = {
+            'users': env_int('BENCH_USERS', 30),
+            'posts': env_int('BENCH_POSTS', 300),
+            'workers': env_int('BENCH_WORKERS', 8),
+            'requests': env_int('BENCH_REQUESTS', 200),
+        }
+        authors, groups = seed_data(
+            self.volumes['users'], self.volumes['posts'], 0)
+        self.reader = authors[0]
+        self.tasks = self.make_tasks(authors, groups)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.baseline = load_baseline()['sqlite:concurrency']
+        self.databases_default = connections.databases[DEFAULT_DB_ALIAS]
+
+    def tearDown(self):
+        connections.databases[DEFAULT_DB_ALIAS] = self.databases_default
+
+    def make_tasks(self, authors, groups):
+        rng = random.Random(SEED)
+        posts = list(Post.objects.values_list('pk', flat=True))
+        tasks = []
+        for number in range(self.volumes['requests']):
+            post = rng.choice(posts)
+            if rng.random() < self.write_share:
+                if number % 2:
+                    tasks.append((
+                        reverse('posts:add_comment', args=[post]),
+                        {'text': f'Комментарий {number}'}))
+                else:
+                    tasks.append((reverse('posts:post_create'),
+                                  {'text': f'Пост {number}'}))
+                continue
+            tasks.append((rng.choice((
+                reverse('posts:index'),
+                reverse('posts:group_list', args=[rng.choice(groups).slug]),
+                reverse('posts:profile',
+                        args=[rng.choice(authors).username]),
+                reverse('posts:post_detail', args=[post]),
+            )), None))
+        return tasks
+
+    def copy_database(self, name):
+        """Копия тестовой базы в файл; возвращает путь к ней."""
+        path = os.path.join(self.directory, f'{name}.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+        return path
+
+    def run_requests(self, name, **options):
+        local = threading.local()
+
+        def request(task):
+            url, data = task
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+                client.force_login(self.reader)
+            start = time.perf_counter()
+            try:
+                if data is None:
+                    ok = client.get(url).status_code == 200
+                else:
+                    ok = client.post(url, data).status_code == 302
+            except OperationalError:
+                ok = False
+            finally:
+                # Как при CONN_MAX_AGE = 0: соединение на каждый запрос
+                connection.close()
+            return ok, (time.perf_counter() - start) * 1000
+
+        # Соединения потоков открываются по копии настроек с файлом
+        # базы, а соединение главного потока со своими настройками держит
+        # базу в памяти и не закрывается. Исходные настройки возвращает
+        # tearDown.
+        connections.databases[DEFAULT_DB_ALIAS] = dict(
+            self.databases_default, NAME=self.copy_database(name))
+        with override_settings(**options):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(self.volumes['workers']) as pool:
+                results = list(pool.map(request, self.tasks))
+            elapsed = time.perf_counter() - start
+        connections.databases[DEFAULT_DB_ALIAS] = self.databases_default
+        timings = [timing for _, timing in results]
+        return {
+            'requests_per_s': round(len(results) / elapsed, 1),
+            'errors': sum(not ok for ok, _ in results),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+        }
+
+    def test_concurrency_within_baseline(self):
+        """С настройками проекта параллельная запись не падает и не
+        медленнее базового показателя"""
+        results = {
+            'default': self.run_requests('default', **DEFAULT_SQLITE),
+            'tuned': self.run_requests('tuned'),
+        }
+        results['speedup'] = round(results['tuned']['requests_per_s']
+                                   / results['default']['requests_per_s'], 2)
+        write_report('concurrency',
+                     {'volumes': self.volumes, 'concurrency': results})
+        self.assertLessEqual(results['tuned']['errors'],
+                             self.baseline['max_errors'])
+        self.assertGreaterEqual(results['tuned']['requests_per_s'],
+                                self.baseline['min_requests_per_s'])
+
+
+@timing
+class TemplateWarmupBenchmark(TestCase):
+    """Первые запросы к лентам и странице поста при свежем кэширующем
+    загрузчике: без прогрева шаблоны разбирают сами запросы, с прогревом
+    это делает compile_all() при старте."""
+    loaders = [(
+        'django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ])]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.iterations = env_int('BENCH_ITERATIONS', 5)
+        authors, groups = seed_data(10, 50, 0)
+        post = Post.objects.first()
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[groups[0].slug]),
+            reverse('posts:profile', args=[authors[0].username]),
+            reverse('posts:post_detail', args=[post.pk]),
+        ]
+        templates = [dict(engine, OPTIONS=dict(engine['OPTIONS']))
+                     for engine in settings.TEMPLATES]
+        templates[0]['OPTIONS']['loaders'] = cls.loaders
+        cls.templates = templates
+        cls.baseline = load_baseline()['templates:first_request']
+
+    def first_requests(self, precompile):
+        """Время прогрева и первых запросов, мс."""
+        # override_settings(TEMPLATES=...) создаёт движки заново
+        with override_settings(TEMPLATES=self.templates):
+            start = time.perf_counter()
+            if precompile:
+                _, errors = compile_all()
+                self.assertFalse(errors)
+            warmup = time.perf_counter() - start
+            start = time.perf_counter()
+            for url in self.urls:
+                cache.clear()
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return warmup * 1000, (time.perf_counter() - start) * 1000
+
+    def test_first_requests_within_baseline(self):
+        """Прогретые шаблоны ускоряют первые запросы"""
+        # Первый прогон прогревает всё, кроме шаблонов
+        self.first_requests(precompile=False)
+        # Прогоны чередуются, чтобы фоновая нагрузка доставалась обоим
+        runs = {'cold': [], 'precompiled': []}
+        for _ in range(self.iterations):
+            runs['cold'].append(self.first_requests(precompile=False))
+            runs['precompiled'].append(self.first_requests(precompile=True))
+        results = {}
+        for mode, timings in runs.items():
+            warmup, requests = min(timings, key=lambda run: run[1])
+            results[mode] = {'warmup_ms': round(warmup, 2),
+                             'first_requests_ms': round(requests, 2)}
+        write_report('templates', {
+            'urls': self.urls, 'iterations': self.iterations,
+            'templates': results})
+        self.assertLess(results['precompiled']['first_requests_ms'],
+                        results['cold']['first_requests_ms'])
+        self.assertLessEqual(results['precompiled']['warmup_ms'],
+                             self.baseline['max_warmup_ms'])
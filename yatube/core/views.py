@@ -1,5 +1,12 @@
 # core/views.py
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_http_methods
+
+from . import metrics, profiling
 
 
 def page_not_found(request, exception):
@@ -16,3 +23,26 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def profiling_stats(request):
+    """Сводка профилирования по представлениям; POST обнуляет её."""
+    if request.method == 'POST':
+        profiling.reset()
+    return JsonResponse({
+        'enabled': settings.REQUEST_PROFILING,
+        'views': profiling.stats(),
+    }, json_dumps_params={'ensure_ascii': False, 'indent': 2})
+
+
+def metrics_view(request):
+    """Метрики для Prometheus, только для адресов из
+    METRICS_ALLOWED_IPS."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4')
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group
+from .search import get_backend
 
 
 @admin.register(Post)
@@ -16,6 +17,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищем по тексту через поисковый индекс, а не LIKE по таблице"""
+        if not search_term:
+            return queryset, False
+        return get_backend().search(queryset, search_term), False
+
 
 class Comment(admin.ModelAdmin):
     list_display = ('name', 'post', 'created',)
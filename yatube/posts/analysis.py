@@ -0,0 +1,129 @@
+"""Анализ русского текста для поиска.
+
+Один и тот же конвейер применяется к текстам постов и комментариев при
+индексации и к запросу при поиске, поэтому «Кошками» находит «кошка»:
+- нормализация Unicode (NFKC) и приведение к нижнему регистру;
+- ё приравнивается к е;
+- разбиение на слова, стоп-слова отбрасываются;
+- слова сводятся к основе стеммером Snowball для русского языка.
+
+analyze_many() обрабатывает пачку текстов сразу: каждое различное слово
+пачки стеммится один раз.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+WORD_RE = re.compile(r'\w+')
+# Стоп-слова Snowball, уже с ё, сведённой к е
+STOP_WORDS = frozenset('''
+    а без более больше будет будто бы был была были было быть в вам вас
+    вдруг ведь во вот впрочем все всегда всего всех всю вы где да даже
+    два для до другой его ее ей ему если есть еще ж же за зачем здесь и
+    из или им иногда их к как какая какой когда конечно кто куда ли
+    лучше между меня мне много может можно мой моя мы на над надо
+    наконец нас не него нее ней нельзя нет ни нибудь никогда ним них
+    ничего но ну о об один он она они опять от перед по под после
+    потом потому почти при про раз разве с сам свою себе себя сейчас
+    со совсем так такой там тебя тем теперь то тогда того тоже только
+    том тот три тут ты у уж уже хорошо хоть чего чем через что чтоб
+    чтобы чуть эти этого этой этом этот эту я
+'''.split())
+
+VOWELS = 'аеиоуыэюя'
+RV_RE = re.compile(rf'^(.*?[{VOWELS}])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+I_ENDING = re.compile(r'и$')
+# Окончание -ость/-ост снимается, только если лежит в R2
+DERIVATIONAL = re.compile(rf'[{VOWELS}][^{VOWELS}].*[{VOWELS}][^{VOWELS}]'
+                          r'.*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+DOUBLE_N = re.compile(r'нн$')
+SOFT_SIGN = re.compile(r'ь$')
+
+
+def normalize(text):
+    """NFKC, нижний регистр и ё → е."""
+    return unicodedata.normalize('NFKC', str(text)).casefold().replace(
+        'ё', 'е')
+
+
+def tokenize(text):
+    """Слова нормализованного текста."""
+    return WORD_RE.findall(normalize(text))
+
+
+def _strip(pattern, text):
+    stripped = pattern.sub('', text, 1)
+    return stripped, stripped != text
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """Основа слова по алгоритму Snowball (Russian).
+
+    Окончания ищутся в RV — части слова после первой гласной.
+    Нерусские слова возвращаются как есть.
+    """
+    match = RV_RE.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    # Шаг 1: деепричастие, иначе возвратная частица и затем
+    # прилагательное (с причастием), глагол или существительное.
+    rv, found = _strip(PERFECTIVE_GERUND, rv)
+    if not found:
+        rv, _ = _strip(REFLEXIVE, rv)
+        rv, found = _strip(ADJECTIVE, rv)
+        if found:
+            rv, _ = _strip(PARTICIPLE, rv)
+        else:
+            rv, found = _strip(VERB, rv)
+            if not found:
+                rv, _ = _strip(NOUN, rv)
+    # Шаг 2
+    rv, _ = _strip(I_ENDING, rv)
+    # Шаг 3
+    if DERIVATIONAL.search(start[-1:] + rv):
+        rv, _ = _strip(DERIVATIONAL_ENDING, rv)
+    # Шаг 4
+    rv, found = _strip(SOFT_SIGN, rv)
+    if not found:
+        rv, _ = _strip(SUPERLATIVE, rv)
+        rv = DOUBLE_N.sub('н', rv, 1)
+    return start + rv
+
+
+def terms(text):
+    """Основы значимых слов текста по порядку."""
+    return [stem(word) for word in tokenize(text) if word not in STOP_WORDS]
+
+
+def analyze(text):
+    """Текст для индекса: основы слов через пробел."""
+    return ' '.join(terms(text))
+
+
+def analyze_many(texts):
+    """analyze() для пачки текстов; каждое слово стеммится один раз."""
+    tokenized = [tokenize(text) for text in texts]
+    vocabulary = {word for words in tokenized for word in words}
+    stems = {word: stem(word) for word in vocabulary - STOP_WORDS}
+    return [
+        ' '.join(stems[word] for word in words if word in stems)
+        for words in tokenized
+    ]
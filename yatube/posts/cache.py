@@ -0,0 +1,228 @@
+"""Кэширование страниц ленты по поколениям.
+
+Любое изменение контента (пост, группа, картинка, имя автора) меняет
+поколение. Страница хранится под ключом своего поколения и потому не
+меняется: её можно держать и в памяти процесса (см. core.cache), а после
+смены поколения во всех процессах просто запрашивается новый ключ.
+Пересчитывает страницу один запрос: остальные отдают прежнюю версию
+(или коротко ждут, если её ещё нет).
+
+Вместе с поколением хранится момент его смены: это Last-Modified
+страниц, которые отдаёт анонимам anonymous_cache_page, — с ETag, ответом
+304 на условный GET и заголовками, по которым страницу может кэшировать
+обратный прокси. Комментарии поколение не меняют, у них своя отметка
+на каждый пост.
+"""
+import hashlib
+import secrets
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag, urlencode
+
+from core import metrics
+
+# (поколение, момент смены)
+GENERATION_KEY = 'posts:changes'
+# Момент последнего изменения комментариев поста
+COMMENTS_KEY = 'posts:comments:{post}'
+# Под PAGE_KEY лежит поколение последней построенной версии страницы,
+# а сама версия — под RENDERED_KEY
+PAGE_KEY = 'posts:page:{user}:{path}'
+RENDERED_KEY = 'posts:rendered:{generation}:{page}'
+# Старые версии никто не удаляет, они истекают сами
+PAGE_TIMEOUT = 60 * 60 * 24
+# Параметры запроса, которые читают страницы; остальные не попадают в
+# ключ, иначе любой ?x=... заводил бы новую запись на PAGE_TIMEOUT
+PAGE_PARAMS = ('page', 'after', 'before', 'q', 'author', 'group')
+# Страница для анонимов по её ETag
+ANONYMOUS_PAGE_KEY = 'posts:anonymous:{etag}'
+# Сколько секунд прокси и браузер отдают страницу анонимам без
+# перепроверки
+ANONYMOUS_MAX_AGE = 60
+# Сколько секунд держится блокировка пересчёта и сколько ждать чужой
+# пересчёт, если устаревшей версии страницы нет. Блокировка берётся через
+# cache.add, поэтому он должен быть атомарен между процессами: у memcached
+# это так, для файлов — core.cache.AtomicFileBasedCache. Со стандартным
+# FileBasedCache блокировка лишь снижает число одновременных пересчётов.
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2
+LOCK_POLL = 0.05
+
+
+def new_generation():
+    # Случайное значение, а не incr: у файлового кэша incr — это чтение и
+    # запись, и одновременные увеличения из разных процессов слились бы
+    # в одно
+    return secrets.randbits(63)
+
+
+def generation_record():
+    """Поколение и момент его смены (timestamp).
+
+    Если запись вытеснена из кэша, поколение начинается заново с
+    текущего момента: страницы лишь перестроятся.
+    """
+    record = cache.get(GENERATION_KEY)
+    if record is None:
+        cache.add(GENERATION_KEY, (new_generation(), time.time()), None)
+        record = cache.get(GENERATION_KEY)
+    return record
+
+
+def get_generation():
+    return generation_record()[0]
+
+
+def changed_at():
+    """Момент последнего изменения контента лент."""
+    return generation_record()[1]
+
+
+def bump_generation():
+    """Помечает все закэшированные страницы ленты устаревшими."""
+    cache.set(GENERATION_KEY, (new_generation(), time.time()), None)
+
+
+def comments_changed_at(post_id):
+    key = COMMENTS_KEY.format(post=post_id)
+    changed = cache.get(key)
+    if changed is None:
+        cache.add(key, time.time(), PAGE_TIMEOUT)
+        changed = cache.get(key)
+    return changed
+
+
+def bump_comments(post_id):
+    """Отмечает изменение комментариев поста."""
+    cache.set(COMMENTS_KEY.format(post=post_id), time.time(), PAGE_TIMEOUT)
+
+
+def page_path(request):
+    """Адрес страницы только с параметрами из PAGE_PARAMS."""
+    query = urlencode([(name, request.GET[name]) for name in PAGE_PARAMS
+                       if name in request.GET])
+    return f'{request.path}?{query}' if query else request.path
+
+
+def page_key(request):
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    return PAGE_KEY.format(user=user, path=page_path(request))
+
+
+def _wait_for_page(key):
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        response = cache.get(key)
+        if response is not None:
+            return response
+    return None
+
+
+def _stale_page(key):
+    generation = cache.get(key)
+    if generation is None:
+        return None
+    return cache.get(RENDERED_KEY.format(generation=generation, page=key))
+
+
+def versioned_cache_page(view):
+    """Кэширует успешные GET-ответы view до смены поколения."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        key = page_key(request)
+        generation = get_generation()
+        rendered_key = RENDERED_KEY.format(generation=generation, page=key)
+        response = cache.get(rendered_key)
+        if response is not None:
+            metrics.cache_result('page', 'hit')
+            return response
+        lock_key = f'{key}:lock'
+        if not cache.add(lock_key, generation, LOCK_TIMEOUT):
+            response = _stale_page(key)
+            if response is not None:
+                metrics.cache_result('page', 'stale')
+                return response
+            response = _wait_for_page(rendered_key)
+            if response is not None:
+                metrics.cache_result('page', 'hit')
+                return response
+            metrics.cache_result('page', 'miss')
+            return view(request, *args, **kwargs)
+        metrics.cache_result('page', 'miss')
+        try:
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(rendered_key, response, PAGE_TIMEOUT)
+                cache.set(key, generation, None)
+        finally:
+            cache.delete(lock_key)
+        return response
+    return wrapper
+
+
+def page_etag(request, state):
+    """ETag страницы: адрес, поколение ленты и состояние её данных."""
+    source = f'{page_path(request)}|{get_generation()}|{state}'
+    return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+def _validated(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True,
+                            max_age=ANONYMOUS_MAX_AGE)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def anonymous_cache_page(page_state):
+    """Кэширует страницу для анонимов и отвечает на условный GET.
+
+    page_state(request, *args, **kwargs) возвращает пару (момент
+    последнего изменения как timestamp, состояние) или None, если объекта
+    страницы нет. Момент берётся из отметок в кэше, а не из базы.
+    Состояние — всё, что ещё меняет страницу без смены поколения:
+    счётчики, отметка комментариев. Залогиненным страница строится
+    заново и помечается private.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                patch_vary_headers(response, ('Cookie',))
+                return response
+            current = page_state(request, *args, **kwargs)
+            if current is None:
+                return view(request, *args, **kwargs)
+            modified, state = current
+            etag = page_etag(request, state)
+            last_modified = int(modified)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                metrics.cache_result('anonymous', 'not_modified')
+                return _validated(response, etag, last_modified)
+            key = ANONYMOUS_PAGE_KEY.format(etag=etag.strip('"'))
+            response = cache.get(key)
+            if response is not None:
+                metrics.cache_result('anonymous', 'hit')
+                return _validated(response, etag, last_modified)
+            metrics.cache_result('anonymous', 'miss')
+            response = view(request, *args, **kwargs)
+            # Ответ с cookie (например, удалённой сессией) чужой
+            if response.status_code == 200 and not response.cookies:
+                cache.set(key, response, PAGE_TIMEOUT)
+            return _validated(response, etag, last_modified)
+        return wrapper
+    return decorator
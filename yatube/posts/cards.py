@@ -0,0 +1,56 @@
+"""Кэш отрендеренных карточек постов (posts/post.html).
+
+Ключ карточки собран из id поста и всего, что в ней выводится: отметки
+изменения поста, картинки и её вариантов, имени автора и группы.
+Поэтому правка любого из них просто даёт новый ключ, а старая карточка
+вытесняется по сроку.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core import metrics
+
+CARD_TEMPLATE = 'posts/post.html'
+CARD_KEY = 'posts:card:{id}:{digest}'
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(post):
+    author, group = post.author, post.group
+    stamp = '|'.join(str(value) for value in (
+        post.edited.timestamp(),
+        post.image.name,
+        post.image_variants,
+        author.username,
+        author.get_full_name(),
+        group.slug if group else '',
+        group.title if group else '',
+    ))
+    digest = hashlib.md5(stamp.encode()).hexdigest()
+    return CARD_KEY.format(id=post.pk, digest=digest)
+
+
+def attach_cards(posts):
+    """Кладёт в post.card готовый HTML карточки для каждого поста.
+
+    Карточки страницы читаются из кэша одним get_many, недостающие
+    рендерятся и сохраняются одним set_many.
+    """
+    keys = {post.pk: card_key(post) for post in posts}
+    cached = cache.get_many(keys.values())
+    rendered = {}
+    for post in posts:
+        key = keys[post.pk]
+        card = cached.get(key)
+        if card is None:
+            card = render_to_string(CARD_TEMPLATE, {'post': post})
+            rendered[key] = card
+        post.card = mark_safe(card)
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    metrics.cache_result('card', 'hit', len(posts) - len(rendered))
+    metrics.cache_result('card', 'miss', len(rendered))
+    return posts
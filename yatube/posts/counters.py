@@ -0,0 +1,61 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарно через F() из сигналов (posts.signals), а
+recount() пересчитывает их целиком, если есть подозрение на расхождение.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def change(queryset, field, delta):
+    """Атомарно меняет счётчик field у объектов queryset на delta."""
+    if delta < 0:
+        # Не уходим ниже нуля, даже если счётчик уже разошёлся с данными
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    change(UserStats.objects.filter(user_id=user_id), field, delta)
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post(post_id, delta):
+    change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def _count(queryset, field, outer='pk'):
+    """Подзапрос COUNT(*) строк queryset, ссылающихся полем field
+    на внешний объект."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef(outer)})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount():
+    """Пересчитывает все счётчики по фактическим данным."""
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in
+         User.objects.filter(stats__isnull=True).values_list('pk', flat=True)]
+    )
+    Post.objects.update(comments_count=_count(Comment.objects, 'post'))
+    Group.objects.update(posts_count=_count(Post.objects, 'group'))
+    UserStats.objects.update(
+        posts_count=_count(Post.objects, 'author', 'user_id'),
+        followers_count=_count(Follow.objects, 'author', 'user_id'),
+        following_count=_count(Follow.objects, 'user', 'user_id'),
+    )
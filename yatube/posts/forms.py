@@ -1,6 +1,10 @@
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 
-from .models import Post, Comment
+from . import uploads
+from .analysis import terms
+from .models import Comment, Group, Post, User
 
 
 class PostForm(forms.ModelForm):
@@ -9,9 +13,70 @@ class PostForm(forms.ModelForm):
         fields = ('text', 'group', 'image')
         localized_fields = ('text', 'group', 'image')
 
+    def __init__(self, data=None, files=None, *args, **kwargs):
+        # Файл, отклонённый обработчиком загрузки, убираем до проверки
+        # поля, иначе вместо причины отказа будет «битая картинка».
+        self.rejected_image = None
+        if files and isinstance(files.get('image'), uploads.RejectedUpload):
+            files = files.copy()
+            self.rejected_image = files.pop('image')[0]
+        super().__init__(data, files, *args, **kwargs)
+
+    def clean_image(self):
+        if self.rejected_image is not None:
+            raise forms.ValidationError(
+                self.rejected_image.error, code='too_large')
+        image = self.cleaned_data.get('image')
+        # Уже сохранённую картинку при правке поста не трогаем
+        if not isinstance(image, UploadedFile):
+            return image
+        if image.size > settings.POST_IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                uploads.too_large_error(), code='too_large')
+        if uploads.has_too_many_pixels(*image.image.size):
+            raise forms.ValidationError(
+                uploads.too_many_pixels_error(), code='too_large')
+        return uploads.sanitize(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ('text',)
         localized_fields = ('text',)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(
+        label='Запрос',
+        max_length=200,
+        widget=forms.TextInput(attrs={'placeholder': 'Поиск по постам'}),
+    )
+    author = forms.ModelChoiceField(
+        label='Автор',
+        queryset=User.objects.all(),
+        to_field_name='username',
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Автор'}),
+    )
+    group = forms.ModelChoiceField(
+        label='Группа',
+        queryset=Group.objects.all(),
+        to_field_name='slug',
+        required=False,
+        empty_label='Все группы',
+    )
+
+    def clean_q(self):
+        query = self.cleaned_data['q']
+        if not terms(query):
+            raise forms.ValidationError('Введите хотя бы одно значимое слово')
+        return query
+
+    def filter(self, posts):
+        """Применяет к постам фильтры по автору и группе"""
+        for name in ('author', 'group'):
+            value = self.cleaned_data.get(name)
+            if value is not None:
+                posts = posts.filter(**{name: value})
+        return posts
@@ -0,0 +1,41 @@
+"""Подсчёт ссылок на общие файлы картинок постов.
+
+Одинаковые картинки хранятся одним файлом (posts.storage), поэтому
+файл и его варианты удаляются, только когда на них не осталось ссылок:
+счётчиком служит число постов с этим именем картинки.
+"""
+import json
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def variant_names(variants):
+    """Имена файлов вариантов из Post.image_variants."""
+    if not variants:
+        return []
+    return [name for files in json.loads(variants)['sources'].values()
+            for _, name in files]
+
+
+def _delete(storage, name):
+    try:
+        storage.delete(name)
+    except (OSError, SuspiciousFileOperation):
+        logger.exception('Не удалось удалить %s', name)
+
+
+def release(name, variants=''):
+    """Удаляет файл картинки и её варианты, если на картинку больше не
+    ссылается ни один пост. Вызывается после коммита удаления."""
+    if not name or Post.objects.filter(image=name).exists():
+        return False
+    _delete(Post._meta.get_field('image').storage, name)
+    for variant in variant_names(variants):
+        _delete(default_storage, variant)
+    return True
@@ -0,0 +1,191 @@
+"""Синтетические данные для нагрузочных замеров.
+
+Генератор строит пользователей, группы, посты, комментарии и подписки,
+похожие на боевые: популярность авторов распределена по закону Ципфа,
+поэтому несколько авторов собирают большую часть подписчиков и пишут
+больше остальных. Тексты собираются из предложений Faker (ru_RU).
+
+Одинаковые параметры и seed дают одинаковый набор данных. Вставка идёт
+через posts.transfer.Importer, то есть пачками bulk_create и с одним
+пересчётом производных данных в конце.
+"""
+import datetime as dt
+import itertools
+import random
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+
+from .models import User
+from .transfer import Importer
+
+SEED = 2022
+# Последний пост датируется этим моментом, чтобы данные не зависели от
+# дня запуска
+EPOCH = dt.datetime(2022, 1, 1, tzinfo=timezone.utc)
+SENTENCES = 1000
+USERNAME = 'load_user_{}'
+# Доля постов, опубликованных в группе
+GROUP_SHARE = 0.7
+
+
+@contextmanager
+def bulk_load_pragmas(cache_mb=256):
+    """Настройки SQLite на время массовой вставки: без fsync на каждую
+    транзакцию, большой кэш страниц и временные таблицы в памяти.
+
+    При сбое посреди загрузки база может потерять последние транзакции,
+    поэтому так грузят только данные, которые можно сгенерировать заново.
+    """
+    # Уровень synchronous нельзя менять внутри транзакции
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    pragmas = {
+        'synchronous': 'OFF',
+        'cache_size': -cache_mb * 1024,
+        'temp_store': 'MEMORY',
+    }
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}')
+            previous[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count по закону Ципфа."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class LoadGenerator:
+    """Строки дампа (см. posts.transfer) для синтетического набора."""
+
+    def __init__(self, users, posts, comments, groups, follows,
+                 exponent=1.1, days=365, seed=SEED):
+        self.users = users
+        self.posts = posts
+        self.comments = comments
+        self.groups = groups
+        self.follows = follows
+        self.days = days
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.usernames = [USERNAME.format(number)
+                          for number in range(users)]
+        # Ранги популярности раздаются пользователям случайно
+        self.popular = self.rng.sample(self.usernames, users)
+        self.weights = zipf_weights(users, exponent)
+        self.sentences = [self.fake.sentence(nb_words=10)
+                          for _ in range(SENTENCES)]
+
+    def create_users(self, batch_size):
+        """Пользователи с именами Faker, без пароля."""
+        for start in range(0, self.users, batch_size):
+            users = []
+            for username in self.usernames[start:start + batch_size]:
+                user = User(username=username,
+                            first_name=self.fake.first_name(),
+                            last_name=self.fake.last_name())
+                user.set_unusable_password()
+                users.append(user)
+            User.objects.bulk_create(users, ignore_conflicts=True)
+
+    def authors(self, count):
+        """count авторов с учётом популярности."""
+        return self.rng.choices(
+            self.popular, cum_weights=self.weights, k=count)
+
+    def text(self):
+        return ' '.join(self.rng.sample(
+            self.sentences, self.rng.randint(1, 6)))
+
+    def moment(self, position):
+        """Момент на шкале постов: 0 — начало периода, self.posts — EPOCH.
+        Пост номер n публикуется между n и n + 1."""
+        span = dt.timedelta(days=self.days)
+        return EPOCH - span + span * position / self.posts
+
+    def rows(self):
+        slugs = [f'load-group-{number}' for number in range(self.groups)]
+        for slug in slugs:
+            yield {'model': 'posts.group', 'fields': {
+                'slug': slug,
+                'title': self.fake.catch_phrase()[:200],
+                'description': self.fake.paragraph(),
+            }}
+        for number, author in enumerate(self.authors(self.posts)):
+            pub_date = self.moment(number + self.rng.random())
+            group = None
+            if slugs and self.rng.random() < GROUP_SHARE:
+                group = self.rng.choice(slugs)
+            yield {'model': 'posts.post', 'pk': number, 'fields': {
+                'author': author,
+                'group': group,
+                'text': self.text(),
+                'pub_date': pub_date.isoformat(),
+                'edited': pub_date.isoformat(),
+                'image': '',
+                'image_variants': '',
+            }}
+        for author in self.authors(self.comments if self.posts else 0):
+            post = self.rng.randrange(self.posts)
+            created = self.moment(post + 1) + dt.timedelta(
+                minutes=self.rng.expovariate(1 / 60))
+            yield {'model': 'posts.comment', 'fields': {
+                'post': post,
+                'author': author,
+                'name': author,
+                'text': self.rng.choice(self.sentences),
+                'created': created.isoformat(),
+            }}
+        yield from self.follow_rows()
+
+    def follow_rows(self):
+        """Подписки: число подписок у читателя в среднем follows,
+        подписчиков у авторов — по закону Ципфа."""
+        if self.users < 2 or self.follows <= 0:
+            return
+        for user in self.usernames:
+            count = min(self.users - 1,
+                        round(self.rng.expovariate(1 / self.follows)))
+            authors = set()
+            # Популярных авторов вытягивают чаще, поэтому повторы
+            # добираются новыми попытками, но не бесконечно
+            for _ in range(count * 4):
+                if len(authors) == count:
+                    break
+                author, = self.authors(1)
+                if author != user:
+                    authors.add(author)
+            for author in sorted(authors):
+                yield {'model': 'posts.follow', 'fields': {
+                    'user': user, 'author': author}}
+
+
+def generate(batch_size, **options):
+    """Генерирует и загружает набор данных, возвращает Counter строк."""
+    generator = LoadGenerator(**options)
+    with bulk_load_pragmas():
+        with transaction.atomic():
+            generator.create_users(batch_size)
+            importer = Importer(batch_size)
+            importer.users.update(User.objects.filter(
+                username__startswith=USERNAME.format('')
+            ).values_list('username', 'pk'))
+            loaded = importer.load_rows(generator.rows())
+        with transaction.atomic():
+            importer.finish()
+    loaded['auth.user'] = options['users']
+    return loaded
@@ -0,0 +1,63 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище по содержимому и '
+            'удаляет повторяющиеся файлы')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        names = list(
+            Post.objects.exclude(image='')
+            .order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        moved = duplicates = missing = freed = 0
+        for name in names:
+            try:
+                with storage.open(name) as source:
+                    hashed = storage.hashed_name(
+                        name, storage.digest(source))
+                    if hashed == name:
+                        continue
+                    if storage.exists(hashed):
+                        duplicates += 1
+                        freed += source.size
+                    else:
+                        storage.save(name, source)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            with transaction.atomic():
+                Post.objects.filter(image=name).update(image=hashed)
+                self.merge_variants(hashed)
+            storage.delete(name)
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено картинок: {moved}, из них повторов: {duplicates} '
+            f'({freed} байт), нет файла: {missing}'))
+
+    def merge_variants(self, name):
+        """Оставляет картинке один набор вариантов, лишние удаляет."""
+        posts = Post.objects.filter(image=name)
+        found = list(
+            posts.exclude(image_variants='')
+            .order_by('image_variants')
+            .values_list('image_variants', flat=True)
+            .distinct()
+        )
+        if not found:
+            return
+        kept, extra = found[0], found[1:]
+        posts.update(image_variants=kept)
+        kept_names = set(images.variant_names(kept))
+        for variants in extra:
+            for variant in images.variant_names(variants):
+                if variant not in kept_names:
+                    default_storage.delete(variant)
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Выгружает группы, посты, комментарии и подписки в JSONL '
+            '(.gz — со сжатием). Файлы картинок не копируются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл дампа, .jsonl или .jsonl.gz')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transfer.open_dump(options['path'], 'w') as file:
+            written = transfer.export(file)
+        elapsed = time.perf_counter() - start
+        total = sum(written.values())
+        for model, count in written.items():
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено строк: {total} за {elapsed:.2f} с '
+            f'({total / elapsed:.0f} строк/с)'))
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import loadgen, transfer
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, постами, '
+            'комментариями и подписками для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Сколько авторов в среднем читает пользователь',
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель закона Ципфа для популярности авторов',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределены посты',
+        )
+        parser.add_argument('--seed', type=int, default=loadgen.SEED)
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE,
+            help='Сколько объектов вставлять за раз',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        loaded = loadgen.generate(
+            options['batch_size'],
+            users=options['users'],
+            posts=options['posts'],
+            comments=options['comments'],
+            groups=options['groups'],
+            follows=options['follows'],
+            exponent=options['exponent'],
+            days=options['days'],
+            seed=options['seed'],
+        )
+        elapsed = time.perf_counter() - start
+        total = sum(loaded.values())
+        for model, count in sorted(loaded.items()):
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {total} за {elapsed:.2f} с '
+            f'({total / elapsed:.0f} строк/с)'))
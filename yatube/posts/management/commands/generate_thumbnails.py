@@ -0,0 +1,57 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def build(name):
+    """Строит варианты одной картинки, ошибки не прерывают команду."""
+    try:
+        return name, thumbnails.build(name)
+    except Exception:
+        logger.exception('Не удалось построить варианты %s', name)
+        return name, None
+
+
+class Command(BaseCommand):
+    help = 'Строит варианты уже загруженных картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, по умолчанию — по числу ядер',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить и картинки, у которых варианты уже есть',
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['force']:
+            posts = posts.filter(image_variants='')
+        names = list(
+            posts.order_by('image')
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        workers = max(1, options['workers'])
+        if workers == 1:
+            results = list(map(build, names))
+        else:
+            # Дочерние процессы откроют собственные соединения с базой
+            connections.close_all()
+            chunksize = max(1, len(names) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(build, names, chunksize=chunksize))
+        variants = {name: meta for name, meta in results if meta is not None}
+        thumbnails.store(variants)
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок обработано: {len(variants)} из {len(names)}'))
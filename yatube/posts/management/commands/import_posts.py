@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ('Загружает дамп export_posts пачками через bulk_create и '
+            'пересчитывает счётчики, ленты и поисковый индекс')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл дампа, .jsonl или .jsonl.gz')
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE,
+            help='Сколько объектов вставлять за раз',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            with transaction.atomic(), \
+                    transfer.open_dump(options['path'], 'r') as file:
+                importer = transfer.Importer(options['batch_size'])
+                loaded = importer.load(file)
+                loaded_at = time.perf_counter()
+                importer.finish()
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Дамп не загружен: {error!r}')
+        total = sum(loaded.values())
+        for model, count in loaded.items():
+            skipped = importer.skipped[model]
+            self.stdout.write(
+                f'{model}: {count}' + (f', пропущено {skipped}'
+                                       if skipped else ''))
+        elapsed = loaded_at - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {total} за {elapsed:.2f} с '
+            f'({total / elapsed:.0f} строк/с), производные данные '
+            f'пересчитаны за {time.perf_counter() - loaded_at:.2f} с'))
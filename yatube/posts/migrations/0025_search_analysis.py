@@ -0,0 +1,193 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:12
+
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+from django.db import migrations
+import posts.models
+
+BATCH_SIZE = 500
+
+# Копия posts.analysis на момент миграции: миграция не должна зависеть
+# от того, как анализатор изменится потом.
+WORD_RE = re.compile(r'\w+')
+# Стоп-слова Snowball, уже с ё, сведённой к е
+STOP_WORDS = frozenset('''
+    а без более больше будет будто бы был была были было быть в вам вас
+    вдруг ведь во вот впрочем все всегда всего всех всю вы где да даже
+    два для до другой его ее ей ему если есть еще ж же за зачем здесь и
+    из или им иногда их к как какая какой когда конечно кто куда ли
+    лучше между меня мне много может можно мой моя мы на над надо
+    наконец нас не него нее ней нельзя нет ни нибудь никогда ним них
+    ничего но ну о об один он она они опять от перед по под после
+    потом потому почти при про раз разве с сам свою себе себя сейчас
+    со совсем так такой там тебя тем теперь то тогда того тоже только
+    том тот три тут ты у уж уже хорошо хоть чего чем через что чтоб
+    чтобы чуть эти этого этой этом этот эту я
+'''.split())
+
+VOWELS = 'аеиоуыэюя'
+RV_RE = re.compile(rf'^(.*?[{VOWELS}])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|'
+    r'ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|'
+    r'ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)|'
+    r'((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|'
+    r'ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+I_ENDING = re.compile(r'и$')
+# Окончание -ость/-ост снимается, только если лежит в R2
+DERIVATIONAL = re.compile(rf'[{VOWELS}][^{VOWELS}].*[{VOWELS}][^{VOWELS}]'
+                          r'.*ость?$')
+DERIVATIONAL_ENDING = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+DOUBLE_N = re.compile(r'нн$')
+SOFT_SIGN = re.compile(r'ь$')
+
+
+def normalize(text):
+    """NFKC, нижний регистр и ё → е."""
+    return unicodedata.normalize('NFKC', str(text)).casefold().replace(
+        'ё', 'е')
+
+
+def tokenize(text):
+    """Слова нормализованного текста."""
+    return WORD_RE.findall(normalize(text))
+
+
+def _strip(pattern, text):
+    stripped = pattern.sub('', text, 1)
+    return stripped, stripped != text
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    """Основа слова по алгоритму Snowball (Russian).
+
+    Окончания ищутся в RV — части слова после первой гласной.
+    Нерусские слова возвращаются как есть.
+    """
+    match = RV_RE.match(word)
+    if match is None:
+        return word
+    start, rv = match.groups()
+    # Шаг 1: деепричастие, иначе возвратная частица и затем
+    # прилагательное (с причастием), глагол или существительное.
+    rv, found = _strip(PERFECTIVE_GERUND, rv)
+    if not found:
+        rv, _ = _strip(REFLEXIVE, rv)
+        rv, found = _strip(ADJECTIVE, rv)
+        if found:
+            rv, _ = _strip(PARTICIPLE, rv)
+        else:
+            rv, found = _strip(VERB, rv)
+            if not found:
+                rv, _ = _strip(NOUN, rv)
+    # Шаг 2
+    rv, _ = _strip(I_ENDING, rv)
+    # Шаг 3
+    if DERIVATIONAL.search(start[-1:] + rv):
+        rv, _ = _strip(DERIVATIONAL_ENDING, rv)
+    # Шаг 4
+    rv, found = _strip(SOFT_SIGN, rv)
+    if not found:
+        rv, _ = _strip(SUPERLATIVE, rv)
+        rv = DOUBLE_N.sub('н', rv, 1)
+    return start + rv
+
+
+def analyze_many(texts):
+    """Основы слов каждого текста через пробел; каждое слово пачки
+    стеммится один раз."""
+    tokenized = [tokenize(text) for text in texts]
+    vocabulary = {word for words in tokenized for word in words}
+    stems = {word: stem(word) for word in vocabulary - STOP_WORDS}
+    return [
+        ' '.join(stems[word] for word in words if word in stems)
+        for words in tokenized
+    ]
+
+
+def recreate_index(apps, schema_editor):
+    # Индекс пересоздаётся с колонкой комментариев и заполняется текстом,
+    # прошедшим анализ. Текст поста весит больше комментариев.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    schema_editor.execute('DROP TABLE posts_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "text, comments, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO posts_search (posts_search, rank) "
+        "VALUES ('rank', 'bm25(4.0, 1.0)')"
+    )
+    batch = []
+    for post in Post.objects.order_by('pk').values_list(
+            'pk', 'text').iterator(BATCH_SIZE):
+        batch.append(post)
+        if len(batch) == BATCH_SIZE:
+            index(Comment, schema_editor, batch)
+            batch = []
+    if batch:
+        index(Comment, schema_editor, batch)
+
+
+def index(Comment, schema_editor, posts):
+    comments = defaultdict(list)
+    for post_id, text in Comment.objects.filter(
+            post_id__in=[pk for pk, _ in posts]).values_list(
+                'post_id', 'text'):
+        comments[post_id].append(text)
+    texts = analyze_many(text for _, text in posts)
+    discussions = analyze_many('\n'.join(comments[pk]) for pk, _ in posts)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO posts_search (rowid, text, comments) '
+            'VALUES (%s, %s, %s)',
+            [(pk, text, discussion) for (pk, _), text, discussion
+             in zip(posts, texts, discussions)],
+        )
+
+
+def restore(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE posts_search')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_search USING fts5("
+        "text, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_search (rowid, text) '
+        'SELECT id, text FROM posts_post'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchentry',
+            name='comments',
+            field=posts.models.SearchTextField(default='', verbose_name='Комментарии'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(recreate_index, restore),
+    ]
@@ -1,7 +1,21 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Substr
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
+# Карточка в ленте показывает первые 50 слов текста,
+# поэтому из базы достаточно взять его начало.
+PREVIEW_LENGTH = 2000
+# Колонки, которые нужны карточке поста и ссылкам ленты.
+FEED_FIELDS = (
+    'pub_date', 'edited', 'image', 'image_variants', 'comments_count',
+    'author', 'author__username', 'author__first_name', 'author__last_name',
+    'group', 'group__slug', 'group__title',
+)
 
 
 # Формируем класс Group, котоырй содержит поля titile, slug, description
@@ -14,6 +28,12 @@ class Group(models.Model):
     description = models.TextField(verbose_name='Описание',
                                    help_text='Описание групы'
                                    )
+    # Счётчик поддерживается сигналами, см. posts.counters
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Заголовок'
@@ -24,6 +44,17 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним JOIN, только нужные
+        колонки и превью вместо полного текста"""
+        return (
+            self.select_related('author', 'group')
+            .only(*FEED_FIELDS)
+            .annotate(preview=Substr('text', 1, PREVIEW_LENGTH))
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -34,6 +65,11 @@ class Post(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    # Отметка последнего изменения: по ней сбрасывается кэш карточки поста
+    edited = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
 
     # Добавляем внешний ключ к моедли User
     author = models.ForeignKey(
@@ -53,20 +89,51 @@ class Post(models.Model):
         null=True,  # (Будет хранить пустые значения)
         on_delete=models.SET_NULL,
     )
+    # Одинаковые картинки хранятся одним файлом, см. posts.storage
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Варианты картинки для srcset, заполняет posts.thumbnails
+    image_variants = models.TextField(
+        verbose_name='Варианты картинки',
+        blank=True,
+        default='',
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        # Индексы под ленты: главная, группа и профиль листаются
+        # по (pub_date, id), см. posts.utils.CursorPaginator.
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+        ]
         verbose_name = 'запись', 'Автор', 'пост'
         verbose_name_plural = 'записи', 'Авторы', 'посты'
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def variants(self):
+        """Описание вариантов картинки или None, если их ещё нет"""
+        return json.loads(self.image_variants) if self.image_variants else None
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -89,6 +156,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('created',)
+        # Комментарии поста листаются по (created, id), см.
+        # posts.utils.COMMENTS_ORDERING.
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+        ]
         verbose_name_plural = 'Коментарии'
         verbose_name = 'Коментарий'
 
@@ -111,9 +184,129 @@ class Follow(models.Model):
     )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
         # удобое читаемое имя в множественнои и единственном числе
         verbose_name_plural = 'Подписки'
         verbose_name = 'Подписка'
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, чтобы профиль и пост не делали COUNT(*)"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Счётчики пользователей'
+        verbose_name = 'Счётчики пользователя'
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: запись на каждый пост автора,
+    на которого подписан пользователь. Заполняется при публикации
+    (fan-out on write), см. posts.timeline."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    # Денормализованные поля поста: отписка удаляет записи по автору,
+    # а лента читается по индексу (user, pub_date, post) без сортировки.
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+        verbose_name_plural = 'Ленты подписок'
+        verbose_name = 'Запись ленты'
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class SearchTextField(models.TextField):
+    """Колонка полнотекстового индекса, понимает lookup match"""
+
+
+def fts_table(lookup, compiler, connection):
+    """Скрытая колонка FTS5 с именем таблицы: MATCH по ней ищет во всех
+    колонках сразу."""
+    alias = compiler.quote_name_unless_alias(lookup.lhs.alias)
+    table = lookup.lhs.target.model._meta.db_table
+    return f'{alias}.{connection.ops.quote_name(table)}'
+
+
+@SearchTextField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        table = fts_table(self, compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{table} MATCH {rhs}', rhs_params
+
+
+class SearchEntry(models.Model):
+    """Строка виртуальной таблицы FTS5 с текстом поста и комментариев.
+
+    Таблицу создаёт миграция (только на SQLite), заполняют сигналы
+    через posts.search; rowid таблицы совпадает с id поста. Тексты
+    хранятся уже разобранными posts.analysis, match ищет по обеим
+    колонкам.
+    """
+    post = models.OneToOneField(
+        Post,
+        primary_key=True,
+        db_column='rowid',
+        on_delete=models.DO_NOTHING,
+        related_name='search_entry',
+        verbose_name='Пост',
+    )
+    text = SearchTextField(verbose_name='Текст')
+    comments = SearchTextField(verbose_name='Комментарии')
+
+    class Meta:
+        managed = False
+        db_table = 'posts_search'
+        verbose_name_plural = 'Поисковый индекс'
+        verbose_name = 'Запись поискового индекса'
+
+    def __str__(self):
+        return f'Индекс {self.post_id}'
@@ -0,0 +1,166 @@
+"""Полнотекстовый поиск по постам.
+
+Поиск идёт через бэкенд из настройки POSTS_SEARCH_BACKEND. Бэкенд
+поддерживает индекс в актуальном состоянии (его вызывают сигналы
+posts.signals) и превращает запрос пользователя в фильтр queryset
+постов с аннотацией rank: чем меньше, тем релевантнее.
+
+SqliteFtsBackend хранит индекс в виртуальной таблице FTS5 (SearchEntry)
+и ранжирует по bm25, SimpleSearchBackend обходится без индекса и
+подходит для баз, где FTS5 нет. Текст и запрос проходят через
+posts.analysis, так что слова находятся в любой форме.
+"""
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Concat
+from django.db.models.expressions import RawSQL
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .analysis import analyze_many, terms
+from .models import Comment, Post, SearchEntry
+
+# Порядок выдачи для курсорной паджинации: релевантность, затем id
+SEARCH_ORDERING = ('rank', 'id')
+# Сколько постов индексировать за один INSERT при перестроении
+INDEX_BATCH_SIZE = 500
+
+
+def nothing(queryset):
+    """Пустая выдача с той же аннотацией rank, что и непустая."""
+    return queryset.none().annotate(
+        rank=Value(0.0, output_field=FloatField()))
+
+
+class BaseSearchBackend:
+    """Интерфейс бэкенда поиска."""
+
+    def index(self, posts):
+        """Добавляет посты в индекс или обновляет их."""
+        raise NotImplementedError
+
+    def remove(self, post_ids):
+        """Убирает посты из индекса."""
+        raise NotImplementedError
+
+    def add_comment(self, comment):
+        """Добавляет в индекс новый комментарий к посту."""
+        self.index(Post.objects.filter(pk=comment.post_id).only('text'))
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        """Посты queryset, подходящие под query, с аннотацией rank,
+        упорядоченные по SEARCH_ORDERING."""
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=INDEX_BATCH_SIZE):
+        """Строит индекс заново, возвращает число проиндексированных
+        постов."""
+        self.clear()
+        total = 0
+        batch = []
+        for post in Post.objects.only('text').order_by('pk').iterator():
+            batch.append(post)
+            if len(batch) == batch_size:
+                self.index(batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            self.index(batch)
+            total += len(batch)
+        return total
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Поиск без индекса: основы всех слов запроса ищутся в тексте через
+    LIKE. Комментарии не учитываются."""
+
+    def index(self, posts):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def add_comment(self, comment):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, query):
+        words = terms(query)
+        if not words:
+            return nothing(queryset)
+        condition = Q()
+        for word in words:
+            # LIKE в SQLite не знает регистра кириллицы, а с заглавной
+            # слово пишется хотя бы в начале предложения
+            condition &= (Q(text__icontains=word)
+                          | Q(text__icontains=word.capitalize()))
+        return queryset.filter(condition).annotate(
+            rank=Value(0.0, output_field=FloatField())
+        ).order_by(*SEARCH_ORDERING)
+
+
+class SqliteFtsBackend(BaseSearchBackend):
+    """Инвертированный индекс FTS5 с ранжированием по bm25."""
+
+    def index(self, posts):
+        posts = list(posts)
+        ids = [post.pk for post in posts]
+        comments = defaultdict(list)
+        for post_id, text in Comment.objects.filter(
+                post_id__in=ids).values_list('post_id', 'text'):
+            comments[post_id].append(text)
+        texts = analyze_many(post.text for post in posts)
+        discussions = analyze_many(
+            '\n'.join(comments[post.pk]) for post in posts)
+        # У FTS5 нет UPSERT: старые строки удаляются и вставляются заново
+        self.remove(ids)
+        SearchEntry.objects.bulk_create(
+            SearchEntry(post_id=post_id, text=text, comments=discussion)
+            for post_id, text, discussion in zip(ids, texts, discussions))
+
+    def remove(self, post_ids):
+        SearchEntry.objects.filter(post_id__in=post_ids).delete()
+
+    def add_comment(self, comment):
+        # Дописывается только новый текст: прежние комментарии поста не
+        # перечитываются и не разбираются заново
+        discussion, = analyze_many([comment.text])
+        SearchEntry.objects.filter(post_id=comment.post_id).update(
+            comments=Concat('comments', Value(f' {discussion}')))
+
+    def clear(self):
+        SearchEntry.objects.all().delete()
+
+    def match(self, query):
+        """Запрос FTS5: основа каждого слова в кавычках, все слова
+        обязательны."""
+        return ' '.join(f'"{word}"' for word in terms(query))
+
+    def search(self, queryset, query):
+        match = self.match(query)
+        if not match:
+            return nothing(queryset)
+        table = SearchEntry._meta.db_table
+        return queryset.filter(search_entry__text__match=match).annotate(
+            rank=RawSQL(f'"{table}"."rank"', (), output_field=FloatField())
+        ).order_by(*SEARCH_ORDERING)
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.POSTS_SEARCH_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'POSTS_SEARCH_BACKEND':
+        get_backend.cache_clear()
@@ -0,0 +1,223 @@
+import threading
+
+from django.db import connections, transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from core import metrics
+
+from . import counters, images, timeline
+from .cache import bump_comments, bump_generation
+from .search import get_backend
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# id постов, которые удаляются в этом потоке прямо сейчас
+_deleting = threading.local()
+
+
+# Счётчики обновляются первыми: по ним лента решает, раскладывать ли
+# посты автора по подписчикам.
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    """Запоминаем прежнюю группу, чтобы перенести счётчик при правке,
+    и прежнюю картинку, если её заменили"""
+    if raw or instance.pk is None:
+        return
+    old_group_id, old_image, old_variants = Post.objects.filter(
+        pk=instance.pk).values_list(
+        'group_id', 'image', 'image_variants').first() or (None, '', '')
+    instance._old_group_id = old_group_id
+    if old_image != instance.image.name:
+        instance._old_image = (old_image, old_variants)
+        instance.image_variants = ''
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+        counters.change_group(instance.group_id, 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    if old_group_id != instance.group_id:
+        counters.change_group(old_group_id, -1)
+        counters.change_group(instance.group_id, 1)
+
+
+def deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+@receiver(pre_delete, sender=Post)
+def mark_deleted_post(sender, instance, **kwargs):
+    """Комментарии удаляемого поста удаляются каскадом раньше него;
+    пересчитывать для каждого индекс, счётчик и кэш поста незачем"""
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def unmark_deleted_post(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+
+
+def post_deleted(comment, using):
+    """Комментарий удаляется вместе со своим постом. Вне транзакции
+    метка не действует: её могло оставить откатившееся удаление."""
+    return (connections[using].in_atomic_block
+            and comment.post_id in deleting_posts())
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'posts_count', -1)
+    counters.change_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, raw=False, **kwargs):
+    """Заменённая картинка удаляется, если на неё больше нет ссылок"""
+    old_image = getattr(instance, '_old_image', None)
+    if raw or old_image is None:
+        return
+    del instance._old_image
+    name, variants = old_image
+    if name != instance.image.name:
+        transaction.on_commit(lambda: images.release(name, variants))
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    """Файл картинки удаляется вместе с последним ссылающимся постом"""
+    name, variants = instance.image.name, instance.image_variants
+    transaction.on_commit(lambda: images.release(name, variants))
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    """Текст поста попадает в поисковый индекс сразу при сохранении"""
+    if not raw and 'text' not in instance.get_deferred_fields():
+        get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_backend().remove([instance.pk])
+
+
+def reindex_commented_post(post_id):
+    get_backend().index(Post.objects.filter(pk=post_id).only('text'))
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, raw=False, **kwargs):
+    """Комментарии ищутся вместе с постом: новый дописывается в индекс,
+    правка переиндексирует пост"""
+    if raw:
+        return
+    if created:
+        get_backend().add_comment(instance)
+    else:
+        reindex_commented_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, using, **kwargs):
+    if not post_deleted(instance, using):
+        reindex_commented_post(instance.post_id)
+
+
+@receiver(post_save, sender=Comment)
+def invalidate_post_page(sender, instance, raw=False, **kwargs):
+    """Комментарии меняют только страницу своего поста"""
+    if not raw:
+        bump_comments(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def invalidate_post_page_on_delete(sender, instance, using, **kwargs):
+    if not post_deleted(instance, using):
+        bump_comments(instance.post_id)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, using, **kwargs):
+    if not post_deleted(instance, using):
+        counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Follow)
+def count_created(sender, created, raw=False, **kwargs):
+    """Метрика созданных объектов для /metrics"""
+    if created and not raw:
+        metrics.inc('yatube_objects_created_total',
+                    model=sender._meta.model_name)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора"""
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    """После подписки в ленте появляются посты автора"""
+    if created and not raw:
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    """После отписки посты автора убираются из ленты"""
+    timeline.prune(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feed_pages(sender, raw=False, **kwargs):
+    """Изменение поста, картинки или группы сбрасывает кэш ленты"""
+    if not raw:
+        bump_generation()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_pages(sender, update_fields=None, raw=False,
+                            **kwargs):
+    """Имя автора выводится в ленте; вход в систему её не меняет"""
+    if not raw and update_fields != frozenset({'last_login'}):
+        bump_generation()
@@ -0,0 +1,43 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл сохраняется под именем из sha256 его содержимого, например
+posts/3a/3a7bd3e2360a3d….jpg: одинаковые загрузки получают одно имя и
+один файл на диске, а значит и один набор вариантов (posts.thumbnails).
+Удалять такой файл можно, только когда на него не ссылается ни один
+пост, см. posts.images.release.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который не пишет уже сохранённое содержимое."""
+
+    @staticmethod
+    def digest(content):
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+        content.seek(0)
+        return sha.hexdigest()
+
+    @staticmethod
+    def hashed_name(name, digest):
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, self.digest(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
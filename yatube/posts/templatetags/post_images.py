@@ -0,0 +1,42 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from posts import thumbnails
+
+register = template.Library()
+
+# Ширина кадра: вся колонка на телефоне, col-md-9 начиная с планшета
+SIZES = '(min-width: 768px) 75vw, 100vw'
+
+
+def _srcset(files):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w' for width, name in files)
+
+
+@register.inclusion_tag('include/picture.html')
+def post_picture(post, sizes=SIZES):
+    """Картинка поста с вариантами для srcset, а пока их нет — исходная.
+
+    Всё нужное берётся из Post.image_variants, файлы не открываются.
+    Варианты ставятся в очередь при сохранении поста и командой
+    generate_thumbnails, а не при рендеринге.
+    """
+    meta = post.variants
+    if not meta or not meta['sources']:
+        return {'src': post.image.url}
+    sources = [
+        {'type': thumbnails.FORMATS[fmt][1], 'srcset': _srcset(files),
+         'src': default_storage.url(files[-1][1])}
+        for fmt, files in meta['sources'].items()
+    ]
+    # Последний формат (обычно JPEG) понимают все браузеры
+    fallback = sources.pop()
+    return {
+        'sources': sources,
+        'src': fallback['src'],
+        'srcset': fallback['srcset'],
+        'sizes': sizes,
+        'width': meta['width'],
+        'height': meta['height'],
+    }
@@ -0,0 +1,88 @@
+"""Общее для бенчмарков: объём данных, базовые показатели и отчёты.
+
+Бенчмарки лежат рядом с тестами своих возможностей. Объём данных и
+число прогонов задаются переменными окружения BENCH_USERS, BENCH_POSTS,
+BENCH_FOLLOWS, BENCH_ITERATIONS, BENCH_INDEX_POSTS, BENCH_WORKERS и
+BENCH_REQUESTS; результат можно выгрузить в JSON (BENCH_OUTPUT=путь).
+Бенчмарк падает, если показатели хуже зафиксированных в
+benchmark_baseline.json. Время и скорость зависят от машины и её
+загрузки, поэтому бенчмарки, которые их мерят, а также медленные и
+многопоточные запускаются только с BENCH_TIMING=1.
+"""
+import json
+import os
+import random
+import unittest
+
+from faker import Faker
+from mixer.backend.django import mixer
+
+from posts import counters, timeline
+from posts.models import Follow, Group, Post, User
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(__file__), 'benchmark_baseline.json')
+SEED = 2022
+# Сравнивать ли время с базовыми показателями и запускать ли медленные
+# бенчмарки
+TIMING = bool(os.getenv('BENCH_TIMING'))
+timing = unittest.skipUnless(
+    TIMING, 'медленный бенчмарк или замер времени: BENCH_TIMING=1')
+
+
+def env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def percentile(values, share):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1,
+                      round(share * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def load_baseline():
+    with open(BASELINE_PATH, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def write_report(suffix, report):
+    """Пишет отчёт в BENCH_OUTPUT; отчёты разных бенчмарков отличаются
+    суффиксом имени."""
+    output = os.getenv('BENCH_OUTPUT')
+    if not output:
+        return
+    if suffix:
+        root, ext = os.path.splitext(output)
+        output = f'{root}.{suffix}{ext}'
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+def seed_data(users, posts, follows, groups=5):
+    """Заполняет базу: пользователи и группы через mixer, посты и
+    подписки через bulk_create, затем пересчитывает производные данные."""
+    fake = Faker('ru_RU')
+    fake.seed_instance(SEED)
+    rng = random.Random(SEED)
+    authors = mixer.cycle(users).blend(
+        User, username=mixer.sequence('bench_user_{0}'))
+    group_list = mixer.cycle(groups).blend(
+        Group, slug=mixer.sequence('bench-group-{0}'))
+    sentences = [fake.sentence(nb_words=12) for _ in range(200)]
+    Post.objects.bulk_create(
+        (Post(author=rng.choice(authors),
+              group=rng.choice(group_list + [None]),
+              text=' '.join(rng.sample(sentences, 5)))
+         for _ in range(posts))
+    )
+    pairs = set()
+    while len(pairs) < min(follows, users * (users - 1)):
+        reader, author = rng.sample(authors, 2)
+        pairs.add((reader.pk, author.pk))
+    Follow.objects.bulk_create(
+        Follow(user_id=reader, author_id=author) for reader, author in pairs)
+    counters.recount()
+    timeline.rebuild()
+    return authors, group_list
@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.test import SimpleTestCase, TestCase
+
+from posts.analysis import analyze, analyze_many, normalize, stem
+from posts.models import Comment, Post
+from posts.search import get_backend
+from posts.tests.bench import (SEED, env_int, load_baseline, seed_data,
+                               timing, write_report)
+
+
+class AnalysisTest(SimpleTestCase):
+    def test_normalize(self):
+        """Регистр, ё и совместимые символы приводятся к одному виду"""
+        self.assertEqual(normalize('ЁЖИК Ёлки ﬁ'), 'ежик елки fi')
+
+    def test_word_forms_share_stem(self):
+        """Формы одного слова сводятся к общей основе"""
+        for forms in (
+            ('кошка', 'кошки', 'кошкой', 'кошками'),
+            ('читать', 'читаю', 'читаются', 'читавши'),
+            ('красивый', 'красивая', 'красивейший'),
+        ):
+            with self.subTest(forms=forms):
+                self.assertEqual(len({stem(form) for form in forms}), 1)
+
+    def test_suffixes(self):
+        """Суффиксы -ость и удвоенная н снимаются"""
+        self.assertEqual(stem('активность'), 'активн')
+        self.assertEqual(stem('длинный'), 'длин')
+
+    def test_stop_words_dropped(self):
+        """Стоп-слова и знаки препинания в индекс не попадают"""
+        self.assertEqual(analyze('И кошка, и собака!'), 'кошк собак')
+        self.assertEqual(analyze('и в на'), '')
+
+    def test_foreign_words_kept(self):
+        """Слова без русских гласных остаются как есть"""
+        self.assertEqual(analyze('Django 2.2'), 'django 2 2')
+
+    def test_analyze_many_matches_analyze(self):
+        """Пакетный разбор совпадает с поштучным"""
+        texts = ['Ёлка в лесу', '', 'Ёлки, ёлки!', 'Про собаку']
+        self.assertEqual(analyze_many(texts), [analyze(t) for t in texts])
+
+
+@timing
+class IndexingBenchmark(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.volumes = {
+            'posts': env_int('BENCH_INDEX_POSTS', 2000),
+            'iterations': env_int('BENCH_ITERATIONS', 5),
+        }
+        authors, _ = seed_data(10, cls.volumes['posts'], 0)
+        rng = random.Random(SEED)
+        posts = list(Post.objects.values_list('pk', 'text'))
+        Comment.objects.bulk_create(
+            Comment(post_id=pk, author=rng.choice(authors),
+                    text=text[:rng.randint(20, 200)])
+            for pk, text in rng.sample(posts, len(posts) // 3))
+        cls.texts = [text for _, text in posts]
+        cls.baseline = load_baseline()['search:index']
+
+    def throughput(self, run):
+        """Лучшая скорость в постах в секунду; кэш основ каждый раз
+        сбрасывается, чтобы мерить холодный разбор."""
+        best = 0.0
+        for _ in range(self.volumes['iterations']):
+            stem.cache_clear()
+            start = time.perf_counter()
+            total = run()
+            best = max(best, total / (time.perf_counter() - start))
+        return round(best)
+
+    def test_indexing_within_baseline(self):
+        """Перестроение индекса не медленнее базового показателя"""
+        results = {
+            'analyze_posts_per_s': self.throughput(
+                lambda: len(analyze_many(self.texts))),
+            'index_posts_per_s': self.throughput(get_backend().rebuild),
+        }
+        write_report('index', {'volumes': self.volumes, 'index': results})
+        self.assertGreaterEqual(
+            results['index_posts_per_s'], self.baseline['min_posts_per_s'])
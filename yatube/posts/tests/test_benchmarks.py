@@ -0,0 +1,95 @@
+"""Бенчмарк представлений posts: число запросов к базе и время ответа.
+
+Число запросов сравнивается с benchmark_baseline.json всегда, время —
+только с BENCH_TIMING=1, см. posts.tests.bench.
+"""
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Post
+from posts.tests.bench import (TIMING, env_int, load_baseline, percentile,
+                               seed_data, write_report)
+from posts.urls import urlpatterns
+
+
+class ViewsBenchmark(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.volumes = {
+            'users': env_int('BENCH_USERS', 30),
+            'posts': env_int('BENCH_POSTS', 300),
+            'follows': env_int('BENCH_FOLLOWS', 100),
+            'iterations': env_int('BENCH_ITERATIONS', 5),
+        }
+        authors, groups = seed_data(
+            cls.volumes['users'], cls.volumes['posts'],
+            cls.volumes['follows'])
+        cls.reader = authors[0]
+        cls.author = Follow.objects.filter(
+            user=cls.reader).first().author
+        cls.group = groups[0]
+        cls.post = Post.objects.create(
+            author=cls.reader, text='Пост читателя', group=cls.group)
+        cls.baseline = load_baseline()
+
+    def url_kwargs(self, pattern):
+        values = {
+            'slug': self.group.slug,
+            'username': self.author.username,
+            'post_id': self.post.pk,
+        }
+        return {name: values[name] for name in pattern.pattern.converters}
+
+    def query(self, name):
+        """GET-параметры запроса к представлению."""
+        if name == 'posts:search':
+            return f'?{urlencode({"q": "пост"})}'
+        return ''
+
+    def prepare(self, name):
+        """Восстанавливает состояние, которое меняет сам запрос."""
+        if name == 'posts:profile_unfollow':
+            Follow.objects.get_or_create(user=self.reader, author=self.author)
+
+    def measure(self, client, name, url):
+        timings, queries, status = [], [], None
+        for _ in range(self.volumes['iterations']):
+            self.prepare(name)
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                status = client.get(url).status_code
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+        return {
+            'url': url,
+            'status': status,
+            'queries': max(queries),
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+        }
+
+    def test_views_within_baseline(self):
+        """Представления posts укладываются в базовые показатели"""
+        client = Client()
+        client.force_login(self.reader)
+        results = {}
+        for pattern in urlpatterns:
+            name = f'posts:{pattern.name}'
+            url = reverse(name, kwargs=self.url_kwargs(pattern))
+            url += self.query(name)
+            results[name] = self.measure(client, name, url)
+        write_report('', {'volumes': self.volumes, 'views': results})
+        for name, result in results.items():
+            limits = self.baseline[name]
+            with self.subTest(view=name):
+                self.assertLessEqual(result['queries'], limits['queries'])
+                if TIMING:
+                    self.assertLessEqual(result['p95_ms'], limits['p95_ms'])
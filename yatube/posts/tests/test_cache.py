@@ -0,0 +1,224 @@
+import time
+from http import HTTPStatus
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from posts.cache import (bump_generation, get_generation, page_key,
+                         versioned_cache_page)
+from posts.cards import card_key
+from posts.models import Comment, Group, Post, User
+
+
+class VersionedCachePageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/?after=abc')
+        self.request.user = AnonymousUser()
+        self.view = mock.Mock(side_effect=lambda request: HttpResponse('ok'))
+        self.cached_view = versioned_cache_page(self.view)
+
+    def test_page_rendered_once_per_generation(self):
+        """Страница пересчитывается только после смены поколения"""
+        self.cached_view(self.request)
+        self.cached_view(self.request)
+        self.assertEqual(self.view.call_count, 1)
+        bump_generation()
+        self.cached_view(self.request)
+        self.assertEqual(self.view.call_count, 2)
+
+    def test_stale_page_served_while_locked(self):
+        """Пока страницу пересчитывает другой запрос, отдаётся старая"""
+        self.cached_view(self.request)
+        bump_generation()
+        key = page_key(self.request)
+        cache.add(f'{key}:lock', get_generation())
+        response = self.cached_view(self.request)
+        self.assertEqual(response.content, b'ok')
+        self.assertEqual(self.view.call_count, 1)
+
+    def test_unknown_params_share_page(self):
+        """Параметры, которые страница не читает, не заводят новых
+        записей кэша"""
+        factory = RequestFactory()
+        for query in ('?after=abc&x=1', '?x=2&after=abc', '?after=abc'):
+            request = factory.get(f'/{query}')
+            request.user = AnonymousUser()
+            self.cached_view(request)
+        self.assertEqual(self.view.call_count, 1)
+        request = factory.get('/?after=def')
+        request.user = AnonymousUser()
+        self.cached_view(request)
+        self.assertEqual(self.view.call_count, 2)
+
+    def test_generation_restored_after_clear(self):
+        """После очистки кэша поколение инициализируется заново"""
+        cache.clear()
+        bump_generation()
+        self.assertIsNotNone(get_generation())
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='card_author')
+        cls.group = Group.objects.create(
+            title='card_group',
+            slug='card-slug',
+            description='card_description'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Текст карточки',
+            group=cls.group,
+        )
+        cls.url = reverse('posts:group_list', kwargs={'slug': 'card-slug'})
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_rendered_once(self):
+        """Повторный запрос берёт карточку из кэша"""
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'posts/post.html')
+        self.assertContains(response, 'Текст карточки')
+        response = self.client.get(self.url)
+        self.assertTemplateNotUsed(response, 'posts/post.html')
+        self.assertContains(response, 'Текст карточки')
+
+    def test_card_key_follows_content(self):
+        """Ключ карточки меняется вместе с постом, автором и группой"""
+        post = Post.objects.select_related('author', 'group').get(
+            pk=self.post.pk)
+        key = card_key(post)
+        post.author.first_name = 'Новое имя'
+        self.assertNotEqual(card_key(post), key)
+        post.author.first_name = ''
+        post.group.title = 'Новая группа'
+        self.assertNotEqual(card_key(post), key)
+        post.group.title = self.group.title
+        post.save()
+        self.assertNotEqual(card_key(post), key)
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='anon_author')
+        cls.group = Group.objects.create(
+            title='anon_group', slug='anon-slug', description='')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост для анонимов', group=cls.group)
+        cls.urls = (
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.author.username]),
+            reverse('posts:post_detail', args=[cls.post.pk]),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_headers(self):
+        """Анонимам отдаются валидаторы и заголовки для прокси"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age=', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+
+    def test_not_modified(self):
+        """Условный GET с тем же ETag получает 304"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_unknown_params_ignored(self):
+        """Посторонний параметр не меняет ETag страницы"""
+        etag = self.client.get(self.urls[0])['ETag']
+        response = self.client.get(self.urls[0], {'utm_source': 'x'})
+        self.assertEqual(response['ETag'], etag)
+        self.assertTemplateNotUsed(response, 'posts/group_list.html')
+
+    def test_page_cached(self):
+        """Повторный запрос не рендерит страницу"""
+        self.client.get(self.urls[0])
+        response = self.client.get(self.urls[0])
+        self.assertTemplateNotUsed(response, 'posts/group_list.html')
+        self.assertContains(response, 'Пост для анонимов')
+
+    def test_etag_follows_content(self):
+        """Новый пост или комментарий меняет ETag"""
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Post.objects.create(
+            author=self.author, text='Новый пост', group=self.group)
+        for url, etag in zip(self.urls[:2], etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertContains(response, 'Новый пост')
+        etag = self.client.get(self.urls[2])['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Свежий комментарий')
+        response = self.client.get(self.urls[2], HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_last_modified_follows_changes(self):
+        """Удаление поста, правка группы и комментарий сдвигают
+        Last-Modified"""
+        extra = Post.objects.create(
+            author=self.author, text='Удалим', group=self.group)
+        changes = (
+            (self.urls[0], extra.delete),
+            (self.urls[1], self.group.save),
+            (self.urls[2], lambda: Comment.objects.create(
+                post=self.post, author=self.author, text='Комментарий')),
+        )
+        clock = [time.time()]
+        with mock.patch('posts.cache.time.time', lambda: clock[0]):
+            for url, change in changes:
+                with self.subTest(url=url):
+                    last_modified = self.client.get(url)['Last-Modified']
+                    clock[0] += 10
+                    change()
+                    response = self.client.get(
+                        url, HTTP_IF_MODIFIED_SINCE=last_modified)
+                    self.assertEqual(response.status_code, HTTPStatus.OK)
+                    self.assertNotEqual(
+                        response['Last-Modified'], last_modified)
+
+    def test_not_modified_single_query(self):
+        """Проверка свежести — один запрос по ключу, без агрегатов"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(1):
+                    self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_authenticated_bypass(self):
+        """Залогиненным страница строится заново и не кэшируется
+        прокси"""
+        self.client.get(self.urls[0])
+        self.client.force_login(self.author)
+        response = self.client.get(self.urls[0])
+        self.assertTemplateUsed(response, 'posts/group_list.html')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_missing_object(self):
+        """Несуществующая группа — обычный 404"""
+        response = self.client.get(
+            reverse('posts:group_list', args=['no-such-group']))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
@@ -1,13 +1,17 @@
+import hashlib
 import tempfile
 import shutil
 
 from http import HTTPStatus
+from io import BytesIO
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.template.defaultfilters import filesizeformat
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from posts.models import Group, Post, Comment
 
@@ -87,7 +91,9 @@ class PostFormTests(TestCase):
         self.assertEqual(Post.objects.count(), count_posts + 1)
         post = Post.objects.latest('id')
         self.assertEqual(response.status_code, HTTPStatus.OK)
-        self.assertEqual(post.image.name, 'posts/small.gif')
+        # Имя файла — sha256 содержимого, см. posts.storage
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(post.image.name, f'posts/{digest[:2]}/{digest}.gif')
         self.assertEqual(post.author, self.post_author)
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group_id, form_data['group'])
@@ -192,3 +198,79 @@ class PostFormTests(TestCase):
         redirect = reverse('login') + '?next=' + reverse('posts:post_create')
         self.assertRedirects(response, redirect)
         self.assertEqual(Post.objects.count(), posts_count)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='upload_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def upload(self, content, name='photo.jpg'):
+        return self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с фото',
+            'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+        })
+
+    def make_image(self, size, exif=True, image_format='JPEG'):
+        buffer = BytesIO()
+        options = {}
+        if exif:
+            image_exif = Image.Exif()
+            # Модель камеры
+            image_exif[0x0110] = 'Camera'
+            options['exif'] = image_exif.tobytes()
+        Image.new('RGB', size, 'red').save(buffer, image_format, **options)
+        return buffer.getvalue()
+
+    @override_settings(POST_IMAGE_MAX_BYTES=100)
+    def test_large_file_rejected(self):
+        """Файл больше лимита не сохраняется, форма сообщает почему"""
+        response = self.upload(self.make_image((20, 20)))
+        self.assertFormError(
+            response, 'form', 'image', f'Файл больше {filesizeformat(100)}')
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_too_many_pixels_rejected(self):
+        """Картинка больше лимита пикселей отклоняется по заголовку"""
+        response = self.upload(self.make_image((1001, 1000)))
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка больше 1 Мпикс')
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+
+    @override_settings(POST_IMAGE_MAX_SIDE=40)
+    def test_exif_stripped_and_downscaled(self):
+        """EXIF удаляется, крупная картинка уменьшается"""
+        self.upload(self.make_image((100, 50)))
+        post = Post.objects.get(author=self.author)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+            self.assertNotIn('exif', image.info)
+
+    def test_png_exif_stripped(self):
+        """EXIF удаляется и из PNG, даже если размер менять не нужно"""
+        self.upload(self.make_image((30, 20), image_format='PNG'),
+                    name='photo.png')
+        post = Post.objects.get(author=self.author)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (30, 20))
+            self.assertNotIn('exif', image.info)
+
+    def test_clean_image_kept_as_is(self):
+        """Картинку без EXIF в пределах лимитов не пережимаем"""
+        content = self.make_image((30, 20), exif=False)
+        self.upload(content)
+        post = Post.objects.get(author=self.author)
+        with open(post.image.path, 'rb') as saved:
+            self.assertEqual(saved.read(), content)
@@ -0,0 +1,63 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.test import TestCase
+
+from posts.models import Comment, Follow, Group, Post, User
+
+OPTIONS = {'users': 40, 'posts': 200, 'comments': 100, 'groups': 3,
+           'follows': 5, 'seed': 7}
+
+
+def snapshot():
+    return (
+        list(User.objects.order_by('username').values_list(
+            'username', 'first_name')),
+        list(Post.objects.order_by('pub_date').values_list(
+            'author__username', 'group__slug', 'text', 'pub_date')),
+        sorted(Comment.objects.values_list(
+            'post__pub_date', 'author__username', 'text')),
+        sorted(Follow.objects.values_list(
+            'user__username', 'author__username')),
+    )
+
+
+class LoadDataTest(TestCase):
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_load_data', **{**OPTIONS, **options},
+                     stdout=out)
+        return out.getvalue()
+
+    def test_volumes(self):
+        """Создаётся заказанное число объектов"""
+        output = self.generate()
+        self.assertIn('строк/с', output)
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertFalse(
+            Follow.objects.filter(user_id=F('author_id')).exists())
+
+    def test_same_seed_same_data(self):
+        """Один seed — один и тот же набор данных"""
+        self.generate()
+        first = snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.generate()
+        self.assertEqual(snapshot(), first)
+        User.objects.all().delete()
+        self.generate(seed=8)
+        self.assertNotEqual(snapshot(), first)
+
+    def test_followers_skewed(self):
+        """Подписчики сосредоточены у немногих авторов"""
+        self.generate(users=200, posts=10, comments=0, follows=10)
+        followers = sorted(
+            User.objects.annotate(total=Count('following'))
+            .values_list('total', flat=True), reverse=True)
+        top = sum(followers[:len(followers) // 10])
+        self.assertGreater(top, sum(followers) / 3)
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Comment, Follow, Group, Post
+from posts.models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -124,3 +127,73 @@ class CommentModelTest(TestCase):
             with self.subTest(value=value):
                 verbose_name = self.comment._meta.get_field(value).verbose_name
                 self.assertEqual(verbose_name, expected)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='counter_author')
+        cls.reader = User.objects.create_user(username='counter_reader')
+        cls.group = Group.objects.create(
+            title='counter_group',
+            slug='counter-slug',
+            description='counter_description',
+        )
+        cls.other_group = Group.objects.create(
+            title='other_group',
+            slug='other-slug',
+            description='other_description',
+        )
+
+    def assertCounters(self, post=None, **expected):
+        stats = {
+            'author_posts': UserStats.objects.get(
+                user=self.author).posts_count,
+            'followers': UserStats.objects.get(
+                user=self.author).followers_count,
+            'following': UserStats.objects.get(
+                user=self.reader).following_count,
+            'group_posts': Group.objects.get(pk=self.group.pk).posts_count,
+        }
+        if post is not None:
+            stats['comments'] = Post.objects.get(pk=post.pk).comments_count
+        for name, value in expected.items():
+            with self.subTest(counter=name):
+                self.assertEqual(stats[name], value)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов"""
+        post = Post.objects.create(
+            author=self.author, text='text', group=self.group)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='comment')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(post, author_posts=1, group_posts=1,
+                            comments=1, followers=1, following=1)
+        comment.delete()
+        follow.delete()
+        self.assertCounters(post, comments=0, followers=0, following=0)
+        post.group = self.other_group
+        post.save()
+        self.assertCounters(group_posts=0)
+        self.assertEqual(
+            Group.objects.get(pk=self.other_group.pk).posts_count, 1)
+        post.delete()
+        self.assertCounters(author_posts=0)
+
+    def test_recount_command_fixes_drift(self):
+        """recount_counters восстанавливает разошедшиеся счётчики"""
+        post = Post.objects.create(
+            author=self.author, text='text', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='c')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(
+            posts_count=42, followers_count=42, following_count=42)
+        Group.objects.update(posts_count=42)
+        Post.objects.update(comments_count=42)
+        out = StringIO()
+        call_command('recount_counters', stdout=out)
+        self.assertIn('Счётчики пересчитаны', out.getvalue())
+        self.assertCounters(post, author_posts=1, group_posts=1,
+                            comments=1, followers=1, following=1)
@@ -0,0 +1,208 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+# Полный проход по таблице в EXPLAIN QUERY PLAN у SQLite:
+# «SCAN posts_post» без «USING INDEX».
+FULL_SCAN = re.compile(
+    r'^SCAN (TABLE )?(posts_post|posts_follow|posts_timeline)\b'
+    r'(?!.*USING (COVERING )?INDEX)'
+)
+
+
+class FeedQueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='plan_author')
+        cls.reader = User.objects.create_user(username='plan_reader')
+        cls.group = Group.objects.create(
+            title='plan_group',
+            slug='plan-slug',
+            description='plan_description',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            Post.objects.create(
+                author=cls.author, text=f'plan {i}', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def feed_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT')]
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не сканируют таблицы постов и подписок целиком"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            for sql in self.feed_queries(url):
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = [row[-1] for row in cursor.fetchall()]
+                with self.subTest(url=url, sql=sql):
+                    scans = [step for step in plan if FULL_SCAN.match(step)]
+                    self.assertEqual(scans, [], plan)
+
+
+class FeedQueryCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='count_author')
+        cls.reader = User.objects.create_user(username='count_reader')
+        cls.group = Group.objects.create(
+            title='count_group',
+            slug='count-slug',
+            description='count_description',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.author.username}),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return len(context.captured_queries)
+
+    def test_feed_query_count_independent_of_page_size(self):
+        """Число запросов ленты не зависит от числа постов на странице"""
+        Post.objects.create(author=self.author, text='один', group=self.group)
+        single = {url: self.count_queries(url) for url in self.urls}
+        for i in range(9):
+            Post.objects.create(
+                author=self.author, text=f'пост {i}', group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), single[url])
+
+    def test_feed_skips_full_text(self):
+        """Лента не выбирает полный текст поста"""
+        Post.objects.create(
+            author=self.author, text='слово ' * 5000, group=self.group)
+        cache.clear()
+        response = self.client.get(self.urls[0])
+        post = response.context['page_obj'][0]
+        self.assertIn('text', post.get_deferred_fields())
+        self.assertContains(response, 'слово')
+
+
+class PostDetailCommentsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='detail_author')
+        cls.post = Post.objects.create(author=cls.author, text='detail')
+        cls.url = reverse('posts:post_detail', kwargs={'post_id': cls.post.pk})
+
+    def add_comments(self, count):
+        start = Comment.objects.count()
+        for i in range(start, start + count):
+            Comment.objects.create(
+                post=self.post, author=self.author, text=f'comment {i}')
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        return len(context.captured_queries), response
+
+    def test_comments_paginated_in_constant_queries(self):
+        """Комментарии выводятся страницами за постоянное число запросов"""
+        self.add_comments(1)
+        single, _ = self.count_queries()
+        self.add_comments(24)
+        queries, response = self.count_queries()
+        self.assertEqual(queries, single)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 10)
+        self.assertIsNotNone(comments.next_cursor)
+        self.assertContains(response, 'Комментариев 25')
+        next_page = self.client.get(
+            self.url, {'after': comments.next_cursor}).context['comments']
+        self.assertEqual(
+            [comment.text for comment in next_page],
+            [f'comment {i}' for i in range(10, 20)])
+
+    def test_comments_page_uses_index(self):
+        """Страница комментариев читается по индексу (post, created, id)
+        без сортировки во временном B-дереве"""
+        self.add_comments(15)
+        first = self.client.get(self.url).context['comments']
+        for params in ({}, {'after': first.next_cursor}):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(self.url, params)
+            queries = [query['sql'] for query in context.captured_queries
+                       if 'FROM "posts_comment"' in query['sql']]
+            self.assertTrue(queries)
+            for sql in queries:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plan = [row[-1] for row in cursor.fetchall()]
+                with self.subTest(params=params, sql=sql):
+                    self.assertTrue(any(
+                        'comment_post_created_idx' in step for step in plan),
+                        plan)
+                    self.assertFalse(any(
+                        'TEMP B-TREE' in step for step in plan), plan)
+
+
+class PostDeleteQueryCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='delete_author')
+
+    def post_with_comments(self, count):
+        post = Post.objects.create(author=self.author, text='Удаляемый пост')
+        for i in range(count):
+            Comment.objects.create(
+                post=post, author=self.author, text=f'Комментарий {i}')
+        return post
+
+    def test_cascade_in_constant_queries(self):
+        """Каскадное удаление комментариев не пересчитывает пост на
+        каждый комментарий"""
+        post = self.post_with_comments(1)
+        with CaptureQueriesContext(connection) as context:
+            post.delete()
+        post = self.post_with_comments(20)
+        with self.assertNumQueries(len(context.captured_queries)):
+            post.delete()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_single_comment_still_counted(self):
+        """Удаление одного комментария по-прежнему меняет счётчик"""
+        post = self.post_with_comments(2)
+        post.comments.first().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
@@ -0,0 +1,160 @@
+from io import StringIO
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (Client, RequestFactory, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Group, Post, SearchEntry, User
+from posts.search import get_backend
+from posts.utils import COUNT_PAGINATOR
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='search_author')
+        cls.other = User.objects.create_user(username='other_author')
+        cls.group = Group.objects.create(
+            title='search_group', slug='search-slug', description='')
+        cls.best = Post.objects.create(
+            author=cls.author, text='Кошка кошка и собака', group=cls.group)
+        cls.worse = Post.objects.create(
+            author=cls.other, text='Кошка спит весь день ' * 5)
+        cls.unrelated = Post.objects.create(
+            author=cls.author, text='Про собаку')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def found(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        return list(response.context['page_obj'])
+
+    def test_results_ranked(self):
+        """Пост, где слово встречается чаще и текст короче, выше"""
+        self.assertEqual(self.found(q='кошка'), [self.best, self.worse])
+
+    def test_all_words_required(self):
+        """Все слова запроса обязательны, регистр не важен"""
+        self.assertEqual(self.found(q='КОШКА Собака'), [self.best])
+
+    def test_word_forms(self):
+        """Слово находится в любой форме, ё равна е"""
+        self.assertEqual(self.found(q='кошками'), [self.best, self.worse])
+        self.assertEqual(
+            set(self.found(q='собаки')), {self.best, self.unrelated})
+        Post.objects.create(author=self.author, text='Зелёная ёлка')
+        self.assertEqual(len(self.found(q='зеленые елки')), 1)
+
+    def test_stop_words_only(self):
+        """Запрос из одних стоп-слов не выполняется"""
+        response = self.client.get(reverse('posts:search'), {'q': 'и в на'})
+        self.assertFalse(response.context['page_obj'])
+        self.assertTrue(response.context['form'].errors)
+
+    def test_comments_indexed(self):
+        """Пост находится по словам из комментариев, но ниже постов,
+        где слово есть в тексте"""
+        comment = Comment.objects.create(
+            post=self.unrelated, author=self.other, text='Кошка тоже тут')
+        self.assertEqual(
+            self.found(q='кошка'), [self.best, self.worse, self.unrelated])
+        comment.delete()
+        self.assertNotIn(self.unrelated, self.found(q='кошка'))
+
+    def test_comment_indexed_incrementally(self):
+        """Новый комментарий дописывается в индекс без перечитывания
+        остальных комментариев поста"""
+        for text in ('Первая кошка', 'Вторая собака'):
+            Comment.objects.create(
+                post=self.unrelated, author=self.other, text=text)
+        with CaptureQueriesContext(connection) as queries:
+            Comment.objects.create(
+                post=self.unrelated, author=self.other, text='Третий енот')
+        self.assertFalse([
+            query for query in queries
+            if query['sql'].startswith('SELECT')
+            and 'posts_comment' in query['sql']])
+        for word in ('кошка', 'собака', 'енот'):
+            with self.subTest(word=word):
+                self.assertIn(self.unrelated, self.found(q=word))
+
+    def test_filters(self):
+        """Результаты фильтруются по автору и группе"""
+        self.assertEqual(
+            self.found(q='кошка', author='other_author'), [self.worse])
+        self.assertEqual(
+            self.found(q='кошка', group='search-slug'), [self.best])
+
+    def test_query_syntax_escaped(self):
+        """Операторы FTS5 в запросе не ломают поиск"""
+        self.assertEqual(self.found(q='"кошка* ('), [self.best, self.worse])
+
+    def test_empty_query(self):
+        """Без запроса выводится только форма"""
+        for params in ({}, {'q': ''}, {'q': '!!!'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('posts:search'), params)
+                self.assertEqual(response.status_code, 200)
+                page_obj = response.context['page_obj']
+                self.assertFalse(page_obj)
+
+    def test_index_follows_changes(self):
+        """Правка и удаление поста сразу отражаются в индексе"""
+        post = Post.objects.get(pk=self.unrelated.pk)
+        post.text = 'Теперь про кошку и кошку'
+        post.save()
+        self.assertIn(post, self.found(q='кошку'))
+        self.assertNotIn(post, self.found(q='собаку'))
+        post.delete()
+        self.assertFalse(
+            SearchEntry.objects.filter(post_id=self.unrelated.pk).exists())
+
+    def test_cursor_pagination_keeps_query(self):
+        """Выдача листается курсором, ссылки сохраняют запрос"""
+        Post.objects.bulk_create(
+            Post(author=self.other, text=f'Кошка номер {number}')
+            for number in range(COUNT_PAGINATOR))
+        get_backend().rebuild()
+        url = reverse('posts:search')
+        response = self.client.get(url, {'q': 'кошка'})
+        first = list(response.context['page_obj'])
+        self.assertEqual(len(first), COUNT_PAGINATOR)
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0'
+                                      f'&amp;after={next_cursor}')
+        response = self.client.get(url, {'q': 'кошка', 'after': next_cursor})
+        second = list(response.context['page_obj'])
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+
+    def test_rebuild_command(self):
+        """Команда заново строит индекс"""
+        SearchEntry.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Проиндексировано постов: 3', out.getvalue())
+        self.assertEqual(self.found(q='кошка'), [self.best, self.worse])
+
+    @override_settings(POSTS_SEARCH_BACKEND='posts.search.SimpleSearchBackend')
+    def test_simple_backend(self):
+        """Бэкенд без индекса находит те же посты"""
+        SearchEntry.objects.all().delete()
+        self.assertEqual(
+            set(self.found(q='Кошка')), {self.best, self.worse})
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через индекс"""
+        post_admin = admin.site._registry[Post]
+        SearchEntry.objects.filter(post_id=self.worse.pk).delete()
+        queryset, use_distinct = post_admin.get_search_results(
+            RequestFactory().get('/'), Post.objects.all(), 'кошка')
+        self.assertEqual(list(queryset), [self.best])
+        self.assertFalse(use_distinct)
@@ -0,0 +1,118 @@
+import hashlib
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from posts import thumbnails
+from posts.models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+DIGEST = hashlib.sha256(SMALL_GIF).hexdigest()
+HASHED_NAME = f'posts/{DIGEST[:2]}/{DIGEST}.gif'
+
+
+def uploaded_gif(name='small.gif'):
+    return SimpleUploadedFile(
+        name=name, content=SMALL_GIF, content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='storage_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_same_content_shares_file(self):
+        """Одинаковые загрузки хранятся одним файлом"""
+        first = Post.objects.create(
+            author=self.author, text='Первый', image=uploaded_gif('a.GIF'))
+        second = Post.objects.create(
+            author=self.author, text='Второй', image=uploaded_gif('b.gif'))
+        self.assertEqual(first.image.name, HASHED_NAME)
+        self.assertEqual(second.image.name, HASHED_NAME)
+        self.assertEqual(
+            default_storage.listdir(f'posts/{DIGEST[:2]}')[1],
+            [f'{DIGEST}.gif'])
+
+    def test_variants_reused(self):
+        """Повторная загрузка получает уже построенные варианты"""
+        first = Post.objects.create(
+            author=self.author, text='Первый', image=uploaded_gif())
+        meta = thumbnails.generate(first.image.name)
+        second = Post.objects.create(
+            author=self.author, text='Второй', image=uploaded_gif())
+        self.assertEqual(second.variants, None)
+        self.assertEqual(thumbnails.generate(second.image.name), meta)
+        self.assertEqual(Post.objects.get(pk=second.pk).variants, meta)
+
+    def test_dedupe_media_command(self):
+        """Команда переносит старые файлы и убирает повторы"""
+        legacy = FileSystemStorage()
+        names = [legacy.save(f'posts/{name}', ContentFile(SMALL_GIF))
+                 for name in ('one.gif', 'two.gif')]
+        for number, name in enumerate(names):
+            post = Post.objects.create(author=self.author, text=number)
+            Post.objects.filter(pk=post.pk).update(image=name)
+        out = StringIO()
+        call_command('dedupe_media', stdout=out)
+        self.assertIn('Перенесено картинок: 2, из них повторов: 1',
+                      out.getvalue())
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)), {HASHED_NAME})
+        for name in names:
+            self.assertFalse(legacy.exists(name))
+        self.assertTrue(legacy.exists(HASHED_NAME))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageReferenceCountTest(TransactionTestCase):
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_file_removed_with_last_post(self):
+        """Файл и варианты удаляются вместе с последним постом"""
+        author = User.objects.create_user(username='first_author')
+        other = User.objects.create_user(username='other_author')
+        post = Post.objects.create(
+            author=author, text='Пост', image=uploaded_gif())
+        Post.objects.create(author=other, text='Копия', image=uploaded_gif())
+        meta = thumbnails.build(HASHED_NAME)
+        thumbnails.store({HASHED_NAME: meta})
+        [[_, variant]] = meta['sources']['jpeg'][:1]
+        post.delete()
+        self.assertTrue(default_storage.exists(HASHED_NAME))
+        # Посты удаляются каскадом вместе с автором
+        other.delete()
+        self.assertFalse(default_storage.exists(HASHED_NAME))
+        self.assertFalse(default_storage.exists(variant))
+
+    def test_replaced_image_released(self):
+        """Заменённая картинка без других ссылок удаляется"""
+        author = User.objects.create_user(username='edit_author')
+        post = Post.objects.create(
+            author=author, text='Пост', image=uploaded_gif())
+        post.image = ContentFile(SMALL_GIF + b'new', name='new.gif')
+        post.save()
+        self.assertFalse(default_storage.exists(HASHED_NAME))
+        self.assertTrue(default_storage.exists(post.image.name))
@@ -0,0 +1,145 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import thumbnails
+from posts.models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def uploaded_gif(name='small.gif'):
+    return SimpleUploadedFile(
+        name=name, content=SMALL_GIF, content_type='image/gif')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='thumb_author')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Пост с картинкой',
+            image=uploaded_gif(),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.name = self.post.image.name
+
+    def test_original_shown_until_variants_ready(self):
+        """Пока вариантов нет, выводится исходная картинка, а рендеринг
+        не ставит варианты в очередь"""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            for url in (reverse('posts:index'),
+                        reverse('posts:post_detail', args=[self.post.pk])):
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertContains(response, self.post.image.url)
+                    self.assertNotContains(response, '<picture>')
+        schedule.assert_not_called()
+
+    def test_picture_shown_when_ready(self):
+        """Готовые варианты выводятся через srcset и в ленте, и в посте"""
+        self.client.get(reverse('posts:index'))
+        meta = thumbnails.generate(self.name)
+        self.assertEqual(list(meta['sources']),
+                         thumbnails.available_formats())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).variants, meta)
+        width, name = meta['sources']['jpeg'][0]
+        for page in (reverse('posts:index'),
+                     reverse('posts:post_detail', args=[self.post.pk])):
+            with self.subTest(page=page):
+                response = self.client.get(page)
+                self.assertContains(response, '<picture>')
+                self.assertContains(response, f'/media/{name} {width}w')
+                self.assertNotContains(response, self.post.image.url)
+
+    @override_settings(POST_IMAGE_WIDTHS=(320, 640),
+                       POST_IMAGE_FORMATS=('jpeg', 'png'))
+    def test_variant_sizes(self):
+        """Варианты не шире исходника и повторяют пропорции кадра"""
+        self.assertEqual(thumbnails.available_formats(), ['jpeg'])
+        meta = thumbnails.build(self.name)
+        # Исходник 2x1: строится только самый узкий вариант
+        self.assertEqual(meta['width'], 320)
+        self.assertEqual(meta['height'], 113)
+        [[width, name]] = meta['sources']['jpeg']
+        self.assertEqual(width, 320)
+        with default_storage.open(name) as variant:
+            self.assertEqual(Image.open(variant).size, (320, 113))
+
+    def test_new_image_resets_variants(self):
+        """Замена картинки сбрасывает устаревшие варианты"""
+        thumbnails.generate(self.name)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Правка текста'
+        post.save()
+        self.assertIsNotNone(Post.objects.get(pk=post.pk).variants)
+        post.image = uploaded_gif('other.gif')
+        post.save()
+        self.assertIsNone(Post.objects.get(pk=post.pk).variants)
+
+    def test_broken_image_not_stored(self):
+        """Битый файл не даёт вариантов"""
+        self.assertIsNone(thumbnails.generate('posts/missing.gif'))
+
+    def test_forms_schedule_thumbnail(self):
+        """Создание и правка поста с картинкой ставят её варианты в очередь"""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.post(reverse('posts:post_create'), {
+                'text': 'Новый пост', 'image': uploaded_gif('new.gif')})
+            self.client.post(
+                reverse('posts:post_edit', args=[self.post.pk]),
+                {'text': 'Правка без картинки'})
+            self.client.post(
+                reverse('posts:post_edit', args=[self.post.pk]),
+                {'text': 'Правка', 'image': uploaded_gif('edit.gif')})
+        names = [call.args[0] for call in schedule.call_args_list]
+        self.assertEqual(names, [
+            Post.objects.get(text='Новый пост').image.name,
+            Post.objects.get(pk=self.post.pk).image.name,
+        ])
+
+    def test_schedule_deduplicates(self):
+        """Одна картинка не ставится в очередь дважды"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit') as hook:
+            thumbnails.schedule(self.name)
+            thumbnails.schedule(self.name)
+        self.assertEqual(hook.call_count, 1)
+
+    def test_generate_thumbnails_command(self):
+        """Команда строит варианты картинок, у которых их ещё нет"""
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('1 из 1', out.getvalue())
+        self.assertIsNotNone(Post.objects.get(pk=self.post.pk).variants)
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('0 из 0', out.getvalue())
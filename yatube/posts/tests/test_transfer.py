@@ -0,0 +1,111 @@
+import datetime as dt
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts.models import (Comment, Follow, Group, Post, Timeline, User,
+                          UserStats)
+from posts.search import get_backend
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+PUB_DATE = timezone.make_aware(dt.datetime(2020, 5, 17, 12, 30))
+
+
+class TransferTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='transfer_author')
+        cls.reader = User.objects.create_user(username='transfer_reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='transfer-group', description='Описание')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Старый пост про кошку')
+        Post.objects.filter(pk=cls.post.pk).update(
+            pub_date=PUB_DATE, edited=PUB_DATE)
+        comment = Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+        Comment.objects.filter(pk=comment.pk).update(created=PUB_DATE)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def export(self, name):
+        path = os.path.join(TEMP_DIR, name)
+        call_command('export_posts', path, stdout=StringIO())
+        return path
+
+    def test_round_trip(self):
+        """Выгруженный контент загружается в пустую базу как был"""
+        path = self.export('dump.jsonl.gz')
+        for model in (Group, User):
+            model.objects.all().delete()
+        out = StringIO()
+        call_command('import_posts', path, batch_size=1, stdout=out)
+        self.assertIn('Загружено строк: 4', out.getvalue())
+        post = Post.objects.get()
+        self.assertEqual(post.text, 'Старый пост про кошку')
+        self.assertEqual((post.pub_date, post.edited), (PUB_DATE, PUB_DATE))
+        self.assertEqual(post.author.username, 'transfer_author')
+        self.assertFalse(post.author.has_usable_password())
+        self.assertEqual(post.group.slug, 'transfer-group')
+        comment = Comment.objects.get()
+        self.assertEqual((comment.post, comment.author.username),
+                         (post, 'transfer_reader'))
+        self.assertEqual(comment.created, PUB_DATE)
+        self.assertTrue(Follow.objects.filter(
+            user__username='transfer_reader',
+            author__username='transfer_author').exists())
+
+    def test_derived_data_rebuilt(self):
+        """После загрузки пересчитаны счётчики, ленты и индекс"""
+        path = self.export('dump.jsonl')
+        Post.objects.all().delete()
+        call_command('import_posts', path, stdout=StringIO())
+        post = Post.objects.get()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.get().posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertTrue(Timeline.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(
+            list(get_backend().search(Post.objects.all(), 'кошки')), [post])
+
+    def test_ids_remapped(self):
+        """Загрузка рядом с существующими постами не трогает их"""
+        path = self.export('dump.jsonl')
+        call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        copy = Post.objects.exclude(pk=self.post.pk).get()
+        self.assertEqual(copy.comments.get().text, 'Комментарий')
+        self.assertEqual(self.post.comments.count(), 1)
+        self.assertEqual(Group.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_broken_dump(self):
+        """Битый дамп откатывается целиком"""
+        path = os.path.join(TEMP_DIR, 'broken.jsonl')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('{"model": "posts.group", "fields": {"slug": "new", '
+                       '"title": "t", "description": ""}}\n{')
+        with self.assertRaisesMessage(CommandError, 'Дамп не загружен'):
+            call_command('import_posts', path, stdout=StringIO())
+        self.assertFalse(Group.objects.filter(slug='new').exists())
+
+    def test_auto_dates_restored(self):
+        """После загрузки auto_now снова проставляет текущее время"""
+        call_command('import_posts', self.export('dump.jsonl'),
+                     stdout=StringIO())
+        post = Post.objects.create(author=self.author, text='Новый')
+        self.assertGreater(post.pub_date, PUB_DATE)
+        self.assertGreater(post.edited, PUB_DATE)
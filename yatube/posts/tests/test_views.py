@@ -9,7 +9,8 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from posts.models import Follow, Group, Post
+from posts import timeline
+from posts.models import Follow, Group, Post, Timeline
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -67,6 +68,64 @@ class PaginatorViewsTest(TestCase):
                 ).object_list), TEST_OF_PAGI_2)
 
 
+class CursorPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='cursor_user')
+        cls.group = Group.objects.create(
+            title='cursor_group',
+            slug='cursor-slug',
+            description='cursor_description'
+        )
+        Post.objects.bulk_create([
+            Post(author=cls.author, text=f'cursor_post {i}', group=cls.group)
+            for i in range(13)
+        ])
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.author.username}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_cursor_tokens(self):
+        """Курсоры ?after=/?before= листают ленту без пропусков"""
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).context['page_obj']
+                self.assertTrue(first.is_cursor)
+                self.assertIsNone(first.previous_cursor)
+                self.assertEqual(list(first), expected[:10])
+                second = self.client.get(
+                    url, {'after': first.next_cursor}).context['page_obj']
+                self.assertEqual(list(second), expected[10:])
+                self.assertIsNone(second.next_cursor)
+                back = self.client.get(
+                    url, {'before': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), expected[:10])
+                self.assertIsNone(back.previous_cursor)
+
+    def test_first_page_skips_count_query(self):
+        """Первая страница строится без COUNT(*), а паджинатор не
+        выдумывает число страниц"""
+        first = self.client.get(self.urls[0]).context['page_obj']
+        self.assertNotIn('count', first.paginator.__dict__)
+        self.assertNotIn('num_pages', first.paginator.__dict__)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый токен отдаёт первую страницу"""
+        response = self.client.get(self.urls[0], {'after': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostsPagesTests(TestCase):
     @classmethod
@@ -166,20 +225,26 @@ class PostsPagesTests(TestCase):
         self.post_info(response.context['post'])
 
     def test_cache_index_page(self):
-        """Проверка работы кеша"""
+        """Главная берётся из кэша, пока контент не изменился"""
         post = Post.objects.create(
             text='Пост под кеш',
             author=self.user)
-        content_add = self.authorized_client.get(
-            reverse('posts:index')).content
+        content_add = self.client.get(reverse('posts:index')).content
+        with self.assertNumQueries(0):
+            content_cached = self.client.get(reverse('posts:index')).content
+        self.assertEqual(content_add, content_cached)
         post.delete()
-        content_delete = self.authorized_client.get(
-            reverse('posts:index')).content
-        self.assertEqual(content_add, content_delete)
-        cache.clear()
-        content_cache_clear = self.authorized_client.get(
-            reverse('posts:index')).content
-        self.assertNotEqual(content_add, content_cache_clear)
+        content_delete = self.client.get(reverse('posts:index')).content
+        self.assertNotEqual(content_add, content_delete)
+        self.assertNotIn('Пост под кеш', content_delete.decode())
+
+    def test_cache_index_page_survives_login(self):
+        """Вход пользователя не сбрасывает кэш главной"""
+        self.client.get(reverse('posts:index'))
+        self.client.force_login(self.user)
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('posts:index'))
 
 
 class FollowViewsTest(TestCase):
@@ -248,3 +313,93 @@ class FollowViewsTest(TestCase):
         response = self.author_client.get(
             reverse('posts:follow_index'))
         self.assertNotIn(post, response.context['page_obj'].object_list)
+
+    def test_timeline_filled_on_post_and_follow(self):
+        """Лента материализуется при подписке и публикации"""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_autor)
+        new_post = Post.objects.create(
+            author=self.post_autor,
+            text='Свежий пост')
+        self.assertEqual(
+            set(Timeline.objects.filter(
+                user=self.post_follower).values_list('post_id', flat=True)),
+            {self.post.id, new_post.id})
+        response = self.author_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post])
+
+    def test_timeline_pruned_on_unfollow(self):
+        """После отписки записи автора удаляются из ленты"""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_autor)
+        self.author_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.post_autor}))
+        self.assertFalse(
+            Timeline.objects.filter(user=self.post_follower).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_hot_author_read_on_demand(self):
+        """Посты популярного автора подмешиваются при чтении"""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_autor)
+        self.assertFalse(Timeline.objects.exists())
+        response = self.author_client.get(reverse('posts:follow_index'))
+        self.assertIn(self.post, response.context['page_obj'].object_list)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_cooled_down_author_fanned_out(self):
+        """Посты, опубликованные, пока автор был популярным, попадают в
+        ленту, когда подписчиков снова становится не больше лимита"""
+        other = User.objects.create(username='other_follower')
+        Follow.objects.create(user=self.post_follower, author=self.post_autor)
+        Follow.objects.create(user=other, author=self.post_autor)
+        hot_post = Post.objects.create(
+            author=self.post_autor, text='Пост популярного автора')
+        self.assertFalse(Timeline.objects.filter(post=hot_post).exists())
+        Follow.objects.filter(user=other).delete()
+        self.assertEqual(
+            set(Timeline.objects.filter(
+                user=self.post_follower).values_list('post_id', flat=True)),
+            {self.post.id, hot_post.id})
+        response = self.author_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [hot_post, self.post])
+
+    def test_follow_index_cursor_pages(self):
+        """Лента подписок листается по курсору без COUNT(*)"""
+        Follow.objects.create(user=self.post_follower, author=self.post_autor)
+        Post.objects.bulk_create(
+            Post(author=self.post_autor, text=f'Пост {i}') for i in range(10))
+        timeline.rebuild()
+        page = self.author_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(len(page), 10)
+        self.assertIsNone(page.previous_cursor)
+        rest = self.author_client.get(
+            reverse('posts:follow_index'),
+            {'after': page.next_cursor}).context['page_obj']
+        self.assertEqual(list(rest), [self.post])
+        self.assertIsNone(rest.next_cursor)
+
+    def test_follow_cursor_survives_hot_author(self):
+        """Курсор ленты подписок остаётся верным, когда автор становится
+        популярным и лента переходит на чтение по постам"""
+        Follow.objects.create(user=self.post_follower, author=self.post_autor)
+        Post.objects.bulk_create(
+            Post(author=self.post_autor, text=f'Пост {i}') for i in range(14))
+        timeline.rebuild()
+        expected = list(Post.objects.filter(
+            author=self.post_autor).order_by('-pub_date', '-id'))
+        page = self.author_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(list(page), expected[:10])
+        with override_settings(TIMELINE_FANOUT_LIMIT=0):
+            rest = self.author_client.get(
+                reverse('posts:follow_index'),
+                {'after': page.next_cursor}).context['page_obj']
+        self.assertEqual(list(rest), expected[10:])
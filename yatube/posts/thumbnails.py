@@ -0,0 +1,164 @@
+"""Фоновая генерация вариантов картинок постов.
+
+Из картинки поста строится набор уменьшенных копий кадра 960x339
+нескольких ширин (POST_IMAGE_WIDTHS) в доступных форматах
+(POST_IMAGE_FORMATS: AVIF и WebP, если их умеет Pillow, и всегда JPEG).
+Это происходит не во время рендеринга страницы, а в пуле потоков после
+сохранения поста (schedule) или командой generate_thumbnails.
+
+Имена и размеры вариантов сохраняются в Post.image_variants, поэтому
+шаблонам для srcset не нужны ни файловая система, ни хранилище sorl.
+Пока вариантов нет, шаблоны показывают исходную картинку.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_generation
+from .models import Post
+
+try:
+    # AVIF появляется в Pillow только с этим плагином
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Пропорции кадра в ленте и на странице поста
+FRAME = (960, 339)
+VARIANTS_DIR = 'posts/variants'
+# Формат: (имя кодека Pillow, MIME-тип, параметры сохранения)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'image/webp', {'quality': 75, 'method': 6}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True,
+                                    'progressive': True}),
+}
+PENDING_KEY = 'posts:thumbnail:{digest}:pending'
+# Сколько секунд не ставить ту же картинку в очередь повторно:
+# защищает от двойной генерации и от повторов для битых файлов.
+PENDING_TIMEOUT = 60
+
+logger = logging.getLogger(__name__)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available_formats():
+    """Форматы из POST_IMAGE_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [fmt for fmt in settings.POST_IMAGE_FORMATS
+            if fmt in FORMATS and FORMATS[fmt][0] in Image.SAVE]
+
+
+def _frame_size(width):
+    return width, round(width * FRAME[1] / FRAME[0])
+
+
+def _widths(image):
+    """Ширины вариантов: крупнее исходника не растягиваем, но хотя бы
+    один вариант строим всегда."""
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    return [width for width in widths if width <= image.width] or widths[:1]
+
+
+def _save(name, image, fmt):
+    codec, _, options = FORMATS[fmt]
+    buffer = BytesIO()
+    image.save(buffer, codec, **options)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build(name):
+    """Строит варианты картинки name и возвращает их описание:
+    {'width', 'height', 'sources': {формат: [[ширина, имя файла], ...]}}.
+    """
+    with Post._meta.get_field('image').storage.open(name) as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+    widths = _widths(image)
+    formats = available_formats()
+    sources = {fmt: [] for fmt in formats}
+    for width in widths:
+        variant = ImageOps.fit(image, _frame_size(width), Image.LANCZOS)
+        for fmt in formats:
+            path = f'{VARIANTS_DIR}/{stem}-{width}.{fmt}'
+            sources[fmt].append([width, _save(path, variant, fmt)])
+    width, height = _frame_size(widths[-1])
+    return {'width': width, 'height': height, 'sources': sources}
+
+
+def store(variants):
+    """Записывает описания вариантов {имя картинки: описание} в посты и
+    сбрасывает кэш лент."""
+    for name, meta in variants.items():
+        # update() не трогает Post.edited: карточка поста сменит ключ
+        # по самому полю image_variants, см. posts.cards.
+        Post.objects.filter(image=name).update(
+            image_variants=json.dumps(meta))
+    if variants:
+        bump_generation()
+
+
+def generate(name):
+    """Строит и сохраняет варианты картинки, возвращает их описание.
+
+    Если та же картинка уже есть у другого поста, её варианты
+    переиспользуются: одинаковые загрузки хранятся одним файлом.
+    """
+    existing = Post.objects.filter(image=name).exclude(
+        image_variants='').values_list('image_variants', flat=True).first()
+    if existing:
+        meta = json.loads(existing)
+        store({name: meta})
+        return meta
+    try:
+        meta = build(name)
+    except Exception:
+        logger.exception('Не удалось построить варианты %s', name)
+        return None
+    store({name: meta})
+    return meta
+
+
+def _run(name):
+    try:
+        generate(name)
+    finally:
+        # Соединения с базой у каждого потока свои
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnail',
+            )
+    return _executor
+
+
+def schedule(name):
+    """Ставит построение вариантов в пул после коммита транзакции."""
+    if not name:
+        return
+    digest = hashlib.md5(name.encode()).hexdigest()
+    if not cache.add(PENDING_KEY.format(digest=digest), True,
+                     PENDING_TIMEOUT):
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run, name))
@@ -0,0 +1,148 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост раскладывается в ленты всех подписчиков автора, при подписке
+лента дополняется постами автора, при отписке — очищается от них.
+Посты «популярных» авторов (подписчиков больше TIMELINE_FANOUT_LIMIT)
+не раскладываются, а подмешиваются в ленту при чтении (fan-out on read),
+чтобы одна публикация не порождала неограниченное число записей. Когда
+автор снова опускается до лимита, пропущенные посты дописываются в ленты.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import Follow, Post, Timeline, UserStats
+from .utils import FEED_ORDERING
+
+# Порядок ленты из Timeline: по её индексу (user, pub_date, post). Курсор
+# хранит те же значения, что и при FEED_ORDERING, — дату и id поста,
+# поэтому остаётся верным, когда автор становится популярным или
+# перестаёт им быть.
+TIMELINE_ORDERING = ('-feed_date', '-feed_id')
+
+
+def is_hot_author(author_id):
+    """Автор слишком популярен для раскладки по лентам."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def hot_author_ids(user):
+    """id популярных авторов, на которых подписан пользователь."""
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    return list(
+        Follow.objects.filter(
+            user=user, author__stats__followers_count__gt=limit
+        ).values_list('author_id', flat=True)
+    )
+
+
+def _bulk_insert(entries):
+    # Размер пачки выбирает сам Django: у SQLite он ограничен числом
+    # параметров запроса.
+    Timeline.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_hot_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(
+        Timeline(user_id=user_id, post_id=post.id,
+                 author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    if is_hot_author(follow.author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=follow.author_id).values_list('id', 'pub_date')
+    _bulk_insert(
+        Timeline(user_id=follow.user_id, post_id=post_id,
+                 author_id=follow.author_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def _insert_select(rows, ignore_conflicts=False):
+    """Вставляет в Timeline строки (user, post, author, pub_date) одним
+    INSERT ... SELECT: на больших данных ленты насчитывают миллионы
+    строк, и гонять их через Python слишком долго."""
+    ops = connection.ops
+    sql, params = rows.query.sql_with_params()
+    table = Timeline._meta
+    columns = ', '.join(
+        ops.quote_name(table.get_field(name).column)
+        for name in ('user', 'post', 'author', 'pub_date'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{ops.insert_statement(ignore_conflicts=ignore_conflicts)} '
+            f'{ops.quote_name(table.db_table)} ({columns}) {sql} '
+            f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts)}',
+            params)
+
+
+def _follower_rows(posts):
+    """Пары (подписчик, пост) для всех подписчиков авторов постов."""
+    return (
+        posts.filter(author__following__isnull=False)
+        .order_by()
+        .values_list('author__following__user_id', 'id', 'author_id',
+                     'pub_date')
+    )
+
+
+def prune(follow):
+    """Убирает из ленты посты автора, от которого отписались.
+
+    Счётчик подписчиков к этому моменту уже уменьшен: если автор только
+    что опустился до TIMELINE_FANOUT_LIMIT, его посты дописываются в
+    ленты оставшихся подписчиков.
+    """
+    Timeline.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id).delete()
+    if UserStats.objects.filter(
+            user_id=follow.author_id,
+            followers_count=settings.TIMELINE_FANOUT_LIMIT).exists():
+        cool_down(follow.author_id)
+
+
+def cool_down(author_id):
+    """Раскладывает по лентам посты автора, опубликованные, пока он был
+    популярным и читался только при чтении ленты."""
+    _insert_select(
+        _follower_rows(Post.objects.filter(author_id=author_id)),
+        ignore_conflicts=True)
+
+
+def rebuild():
+    """Заново строит все ленты по подпискам, например после загрузки
+    данных через bulk_create, минуя сигналы."""
+    Timeline.objects.all().delete()
+    _insert_select(_follower_rows(Post.objects.exclude(
+        author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT)))
+
+
+def feed(user):
+    """Посты ленты подписок пользователя и их порядок для паджинации.
+
+    Без популярных авторов это один проход по индексу
+    (user, pub_date, post) таблицы Timeline.
+    """
+    hot = hot_author_ids(user)
+    if not hot:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_id=F('timeline_entries__post_id'))
+        return posts, TIMELINE_ORDERING
+    return Post.objects.filter(
+        Q(pk__in=Timeline.objects.filter(user=user).values('post_id'))
+        | Q(author_id__in=hot)
+    ), FEED_ORDERING
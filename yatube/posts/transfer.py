@@ -0,0 +1,264 @@
+"""Выгрузка и загрузка контента в JSONL.
+
+Каждая строка — объект {"model": ..., "pk": ..., "fields": {...}}, как у
+сериализаторов Django. Авторы и группы записываются естественными ключами
+(username и slug), посты — своим id, на который ссылаются комментарии.
+Модели идут в порядке зависимостей: группы, посты, комментарии, подписки.
+
+Загрузка читает файл построчно и вставляет объекты пачками, минуя
+сигналы; id постов из файла сопоставляются новым через
+словарь в памяти. Производные данные (счётчики, ленты, поисковый индекс)
+пересчитываются один раз в конце.
+"""
+import gzip
+import json
+from collections import Counter
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from . import counters, timeline
+from .cache import bump_generation
+from .models import Comment, Follow, Group, Post, User
+from .search import get_backend
+
+BATCH_SIZE = 1000
+MODELS = {
+    'posts.group': Group,
+    'posts.post': Post,
+    'posts.comment': Comment,
+    'posts.follow': Follow,
+}
+
+
+def open_dump(path, mode):
+    """Текстовый файл дампа; .gz сжимается и распаковывается на лету."""
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _rows():
+    """Строки дампа в порядке зависимостей."""
+    for slug, title, description in Group.objects.order_by('pk').values_list(
+            'slug', 'title', 'description'):
+        yield 'posts.group', None, {
+            'slug': slug, 'title': title, 'description': description}
+    yield from (
+        ('posts.post', pk, {
+            'author': author, 'group': group, 'text': text,
+            'pub_date': pub_date.isoformat(), 'edited': edited.isoformat(),
+            'image': image, 'image_variants': variants,
+        })
+        for pk, author, group, text, pub_date, edited, image, variants
+        in Post.objects.order_by('pk').values_list(
+            'pk', 'author__username', 'group__slug', 'text', 'pub_date',
+            'edited', 'image', 'image_variants').iterator(BATCH_SIZE)
+    )
+    yield from (
+        ('posts.comment', None, {
+            'post': post, 'author': author, 'name': name, 'text': text,
+            'created': created.isoformat(),
+        })
+        for post, author, name, text, created
+        in Comment.objects.order_by('pk').values_list(
+            'post_id', 'author__username', 'name', 'text',
+            'created').iterator(BATCH_SIZE)
+    )
+    yield from (
+        ('posts.follow', None, {'user': user, 'author': author})
+        for user, author in Follow.objects.order_by('pk').values_list(
+            'user__username', 'author__username').iterator(BATCH_SIZE)
+    )
+
+
+def export(file):
+    """Пишет весь контент в file, возвращает Counter строк по моделям."""
+    written = Counter()
+    for model, pk, fields in _rows():
+        row = {'model': model, 'fields': fields}
+        if pk is not None:
+            row['pk'] = pk
+        file.write(json.dumps(row, ensure_ascii=False))
+        file.write('\n')
+        written[model] += 1
+    return written
+
+
+@contextmanager
+def keep_dates(model):
+    """Выключает auto_now и auto_now_add у полей модели.
+
+    Иначе bulk_create проставит текущее время вместо дат из дампа.
+    Меняются общие на процесс объекты полей, поэтому годится только
+    для команды загрузки, не для запросов.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False)
+              or getattr(field, 'auto_now_add', False)]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """Загружает строки дампа пачками по batch_size.
+
+    Пачка сбрасывается, когда заполнилась или когда в файле началась
+    другая модель, поэтому комментарии всегда видят уже вставленные посты.
+    Недостающие авторы создаются без пароля. Пачка уходит в bulk_create
+    одной транзакцией; у SQLite число параметров в запросе ограничено,
+    поэтому размер пачки урезается до connection.ops.bulk_batch_size.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.users = {}
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.posts = {}
+        self.model = None
+        self.batch = []
+        self.loaded = Counter()
+        self.skipped = Counter()
+        self.next_pk = {
+            model: (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+            for model in (Post, Comment)
+        }
+
+    def load(self, file):
+        """Загружает дамп из открытого файла."""
+        return self.load_rows(
+            json.loads(line) for line in file if line.strip())
+
+    def load_rows(self, rows):
+        """Загружает строки дампа, уже разобранные в словари."""
+        for row in rows:
+            if row['model'] not in MODELS:
+                raise ValueError(f'Неизвестная модель: {row["model"]}')
+            full = len(self.batch) == self.batch_size
+            if full or row['model'] != self.model:
+                self.flush()
+                self.model = row['model']
+            self.batch.append(row)
+        self.flush()
+        return self.loaded
+
+    def flush(self):
+        if self.batch:
+            loader = getattr(self, f'load_{self.model.split(".")[1]}')
+            loader(self.batch)
+            self.batch = []
+
+    def resolve_users(self, usernames):
+        """id пользователей по username; недостающие создаются."""
+        missing = set(usernames) - self.users.keys()
+        if not missing:
+            return
+        self.users.update(User.objects.filter(
+            username__in=missing).values_list('username', 'pk'))
+        new = missing - self.users.keys()
+        if new:
+            users = [User(username=username) for username in sorted(new)]
+            for user in users:
+                user.set_unusable_password()
+            User.objects.bulk_create(users)
+            self.users.update(User.objects.filter(
+                username__in=new).values_list('username', 'pk'))
+
+    def allocate(self, model, count):
+        """Диапазон id под новые объекты.
+
+        id задаются явно: bulk_create на SQLite не возвращает их, а без
+        них не заполнить словарь постов.
+        """
+        start = self.next_pk[model]
+        self.next_pk[model] += count
+        return range(start, start + count)
+
+    def load_group(self, rows):
+        Group.objects.bulk_create(
+            [Group(**row['fields']) for row in rows
+             if row['fields']['slug'] not in self.groups],
+            ignore_conflicts=True,
+        )
+        self.groups.update(Group.objects.filter(
+            slug__in=[row['fields']['slug'] for row in rows]
+        ).values_list('slug', 'pk'))
+        self.loaded['posts.group'] += len(rows)
+
+    def load_post(self, rows):
+        self.resolve_users(row['fields']['author'] for row in rows)
+        posts = []
+        for pk, row in zip(self.allocate(Post, len(rows)), rows):
+            fields = row['fields']
+            self.posts[row['pk']] = pk
+            posts.append(Post(
+                pk=pk,
+                author_id=self.users[fields['author']],
+                group_id=self.groups.get(fields['group']),
+                text=fields['text'],
+                image=fields['image'],
+                image_variants=fields['image_variants'],
+                pub_date=parse_datetime(fields['pub_date']),
+                edited=parse_datetime(fields['edited']),
+            ))
+        self.insert(Post, posts)
+        self.loaded['posts.post'] += len(posts)
+
+    def load_comment(self, rows):
+        known = [row for row in rows if row['fields']['post'] in self.posts]
+        self.skipped['posts.comment'] += len(rows) - len(known)
+        self.resolve_users(row['fields']['author'] for row in known)
+        comments = [
+            Comment(
+                pk=pk,
+                post_id=self.posts[row['fields']['post']],
+                author_id=self.users[row['fields']['author']],
+                name=row['fields']['name'],
+                text=row['fields']['text'],
+                created=parse_datetime(row['fields']['created']),
+            )
+            for pk, row in zip(self.allocate(Comment, len(known)), known)
+        ]
+        self.insert(Comment, comments)
+        self.loaded['posts.comment'] += len(comments)
+
+    def load_follow(self, rows):
+        pairs = [(row['fields']['user'], row['fields']['author'])
+                 for row in rows]
+        self.resolve_users(name for pair in pairs for name in pair)
+        follows = [
+            Follow(user_id=self.users[user], author_id=self.users[author])
+            for user, author in pairs if user != author
+        ]
+        self.skipped['posts.follow'] += len(rows) - len(follows)
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        self.loaded['posts.follow'] += len(follows)
+
+    def insert(self, model, objs):
+        """Вставляет объекты с датами из дампа."""
+        fields = model._meta.concrete_fields
+        size = min(self.batch_size,
+                   connection.ops.bulk_batch_size(fields, objs))
+        with transaction.atomic(), keep_dates(model):
+            model.objects.bulk_create(objs, batch_size=max(size, 1))
+
+    def finish(self):
+        """Сдвигает последовательности id и пересчитывает производные
+        данные."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]):
+                cursor.execute(sql)
+        counters.recount()
+        timeline.rebuild()
+        get_backend().rebuild()
+        bump_generation()
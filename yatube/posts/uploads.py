@@ -0,0 +1,124 @@
+"""Ограничения и обработка загружаемых картинок постов.
+
+BoundedImageUploadHandler стоит первым в FILE_UPLOAD_HANDLERS и считает
+байты по мере чтения запроса, а по первым килобайтам файла узнаёт
+размер картинки в пикселях. Если файл больше POST_IMAGE_MAX_BYTES или
+картинка больше POST_IMAGE_MAX_PIXELS, остаток файла никуда не
+сохраняется, а форма получает RejectedUpload и показывает ошибку.
+
+sanitize() убирает EXIF (в том числе координаты съёмки) и уменьшает
+картинки крупнее POST_IMAGE_MAX_SIDE до сохранения в MEDIA_ROOT/posts/.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+# Сколько начальных байт файла достаточно, чтобы прочитать заголовок
+# картинки: у JPEG перед размерами может идти EXIF до 64 КБ.
+HEADER_LIMIT = 256 * 1024
+JPEG_QUALITY = 90
+
+
+def too_large_error():
+    return f'Файл больше {filesizeformat(settings.POST_IMAGE_MAX_BYTES)}'
+
+
+def too_many_pixels_error():
+    megapixels = settings.POST_IMAGE_MAX_PIXELS / 1000 / 1000
+    return f'Картинка больше {megapixels:g} Мпикс'
+
+
+def has_too_many_pixels(width, height):
+    return width * height > settings.POST_IMAGE_MAX_PIXELS
+
+
+class RejectedUpload(InMemoryUploadedFile):
+    """Пустой файл на месте отклонённой загрузки с причиной отказа."""
+
+    def __init__(self, field_name, name, content_type, error):
+        super().__init__(
+            BytesIO(), field_name, name, content_type, 0, None)
+        self.error = error
+
+
+class BoundedImageUploadHandler(FileUploadHandler):
+    """Отклоняет слишком большие файлы и картинки, не дочитывая их."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            # Остаток отклонённого файла не передаём следующим
+            # обработчикам, он просто вычитывается из запроса.
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.error = too_large_error()
+            return None
+        if self.header is not None:
+            self.header += raw_data
+            self.check_header()
+            if self.error:
+                return None
+        return raw_data
+
+    def check_header(self):
+        try:
+            # Image.open читает только заголовок и не декодирует пиксели
+            with Image.open(BytesIO(self.header)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self.error = too_many_pixels_error()
+            return
+        except Exception:
+            # Заголовок ещё не дочитан или это не картинка: второе
+            # проверит ImageField формы.
+            if len(self.header) >= HEADER_LIMIT:
+                self.header = None
+            return
+        self.header = None
+        if has_too_many_pixels(width, height):
+            self.error = too_many_pixels_error()
+
+    def file_complete(self, file_size):
+        if self.error:
+            return RejectedUpload(
+                self.field_name, self.file_name, self.content_type,
+                self.error)
+        return None
+
+
+def sanitize(upload):
+    """Возвращает картинку без EXIF и не крупнее POST_IMAGE_MAX_SIDE.
+
+    Картинки, которые менять не нужно, и анимации возвращаются как есть.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    side = settings.POST_IMAGE_MAX_SIDE
+    oversized = max(image.size) > side
+    if getattr(image, 'is_animated', False) or not (
+            oversized or 'exif' in image.info):
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    if oversized:
+        # JPEG сразу декодируется в уменьшенном масштабе
+        image.draft(image.mode, (side, side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((side, side), Image.LANCZOS)
+    # PNG и WebP при сохранении берут EXIF из info, если его не передать
+    image.info.pop('exif', None)
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=JPEG_QUALITY, exif=b'')
+    return InMemoryUploadedFile(
+        buffer, upload.field_name, upload.name, upload.content_type,
+        buffer.tell(), None)
@@ -1,10 +1,126 @@
+import binascii
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
 COUNT_PAGINATOR = 10
+# Порядок ленты для курсорной паджинации: (поле даты, id) по убыванию.
+FEED_ORDERING = ('-pub_date', '-id')
+# Комментарии читаются от старых к новым.
+COMMENTS_ORDERING = ('created', 'id')
+CURSOR_SEPARATOR = '|'
 
 
-def paginate(posts, request):
-    """Функция паджинации"""
-    paginator = Paginator(posts, COUNT_PAGINATOR)
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (keyset) без COUNT(*) и OFFSET.
+
+    Выборка упорядочивается по двум полям ordering (второе — уникальное),
+    страница берётся как page_size + 1 строк после/до курсора.
+
+    Страница — обычный Page с токенами next_cursor и previous_cursor
+    (None, если соседней страницы нет); навигация строится по ним.
+    Общего числа страниц она не знает, а number — 1 на первой странице и
+    2 на остальных, чтобы has_previous() отвечал верно. Паджинатор не
+    трогается: его num_pages, как и has_next(), посчитал бы COUNT(*) по
+    всей выборке.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING):
+        self.ordering = ordering
+        super().__init__(object_list.order_by(*ordering), per_page)
+
+    def _fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def _field(self, name):
+        """Поле модели или аннотации (например, rank поиска)."""
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [str(getattr(obj, name)) for name in self._fields()]
+        return urlsafe_base64_encode(
+            force_bytes(CURSOR_SEPARATOR.join(values)))
+
+    def decode_cursor(self, token):
+        """Возвращает значения полей курсора или None для битого токена."""
+        try:
+            raw = force_str(urlsafe_base64_decode(token))
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            return None
+        values = raw.split(CURSOR_SEPARATOR)
+        if len(values) != len(self.ordering):
+            return None
+        try:
+            return [self._field(name).to_python(value)
+                    for name, value in zip(self._fields(), values)]
+        except ValidationError:
+            return None
+
+    def _seek(self, values, backwards):
+        """Фильтр строк строго после курсора (или до него)."""
+        (first, second), (first_value, second_value) = self._fields(), values
+        descending = self.ordering[0].startswith('-')
+        lookup = 'gt' if descending == backwards else 'lt'
+        return (
+            Q(**{f'{first}__{lookup}': first_value})
+            | Q(**{first: first_value, f'{second}__{lookup}': second_value})
+        )
+
+    def get_cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или до курсора before.
+
+        Некорректный токен трактуется как запрос первой страницы.
+        """
+        queryset = self.object_list
+        values = None
+        backwards = False
+        if before:
+            values = self.decode_cursor(before)
+            backwards = values is not None
+        if values is None and after:
+            values = self.decode_cursor(after)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            if not rows:
+                return self.get_cursor_page()
+            rows.reverse()
+        at_start = values is None or (backwards and not has_more) or not rows
+        has_next = backwards or has_more
+        page = self._get_page(rows, 1 if at_start else 2, self)
+        page.is_cursor = True
+        page.next_cursor = (
+            self.encode_cursor(rows[-1]) if rows and has_next else None)
+        page.previous_cursor = (
+            None if at_start else self.encode_cursor(rows[0]))
+        return page
+
+
+def paginate(posts, request, cursor=False, ordering=FEED_ORDERING):
+    """Функция паджинации.
+
+    По умолчанию — нумерованные страницы (?page=). С cursor=True лента
+    листается по токенам ?after=/?before= без подсчёта общего числа
+    записей (порядок задаёт ordering); старые ссылки вида ?page= при
+    этом продолжают работать.
+    """
     page_number = request.GET.get('page')
+    if cursor and page_number is None:
+        paginator = CursorPaginator(posts, COUNT_PAGINATOR, ordering)
+        return paginator.get_cursor_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    paginator = Paginator(posts, COUNT_PAGINATOR)
     return paginator.get_page(page_number)
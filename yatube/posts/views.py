@@ -1,62 +1,123 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
-from django.views.decorators.cache import cache_page
 
-from .forms import PostForm, CommentForm
+from . import thumbnails, timeline
+from .cache import (anonymous_cache_page, changed_at, comments_changed_at,
+                    versioned_cache_page)
+from .cards import attach_cards
+from .forms import PostForm, CommentForm, SearchForm
 from .models import Post, Group, User, Follow
-from .utils import paginate
+from .search import SEARCH_ORDERING, get_backend
+from .utils import COMMENTS_ORDERING, paginate
 
 
-@cache_page(20)
+@versioned_cache_page
 def index(request):
     """Возвращает главную страницу"""
-    posts = Post.objects.select_related('author').all()
+    posts = Post.objects.for_feed()
     context = {
-        'page_obj': paginate(posts, request),
+        'page_obj': attach_cards(paginate(posts, request, cursor=True)),
     }
     return render(request, 'posts/index.html', context)
 
 
+def group_state(request, slug):
+    """Число постов группы"""
+    posts_count = Group.objects.filter(slug=slug).values_list(
+        'posts_count', flat=True).first()
+    if posts_count is None:
+        return None
+    return changed_at(), posts_count
+
+
+@anonymous_cache_page(group_state)
 def group_posts(request, slug):
     """Возвращает страницу групп"""
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related()
+    posts = group.posts.for_feed()
     context = {
         'group': group,
-        'page_obj': paginate(posts, request),
+        'page_obj': attach_cards(paginate(posts, request, cursor=True)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+def profile_state(request, username):
+    """Счётчики автора"""
+    state = User.objects.filter(username=username).values_list(
+        'stats__posts_count', 'stats__followers_count',
+        'stats__following_count').first()
+    if state is None:
+        return None
+    return changed_at(), state
+
+
+@anonymous_cache_page(profile_state)
 def profile(request, username):
     """Возвращает профайл пользователя"""
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('author').all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = author.posts.for_feed()
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user,
         author=author
-    )
+    ).exists()
     context = {
         'author': author,
         'following': following,
-        'page_obj': paginate(posts, request),
+        'page_obj': attach_cards(paginate(posts, request, cursor=True)),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_detail_state(request, post_id):
+    """Отметка комментариев поста и счётчики страницы"""
+    state = Post.objects.filter(pk=post_id).values_list(
+        'comments_count', 'author__stats__posts_count').first()
+    if state is None:
+        return None
+    comments = comments_changed_at(post_id)
+    return max(changed_at(), comments), (state, comments)
+
+
+@anonymous_cache_page(post_detail_state)
 def post_detail(request, post_id):
     """Возвращает детальную информацию о посте"""
     post = get_object_or_404(
-        Post.objects.select_related('author', 'group'),
+        Post.objects.select_related('author__stats', 'group'),
         pk=post_id)
     form = CommentForm(request.POST or None)
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
         'form': form,
+        'comments': paginate(
+            comments, request, cursor=True, ordering=COMMENTS_ORDERING),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def search(request):
+    """Возвращает найденные посты, самые релевантные первыми"""
+    form = SearchForm(request.GET or None)
+    page_obj = None
+    if form.is_valid():
+        posts = form.filter(Post.objects.for_feed())
+        posts = get_backend().search(posts, form.cleaned_data['q'])
+        page_obj = attach_cards(paginate(
+            posts, request, cursor=True, ordering=SEARCH_ORDERING))
+    # Ссылки паджинатора сохраняют запрос и фильтры
+    query = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        query.pop(name, None)
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+        'query_string': f'{query.urlencode()}&' if query else '',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -79,6 +140,7 @@ def post_create(request):
         create_post = form.save(commit=False)
         create_post.author = request.user
         create_post.save()
+        thumbnails.schedule(create_post.image.name)
         return redirect('posts:profile', create_post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -95,7 +157,9 @@ def post_edit(request, post_id):
         files=request.FILES or None,
         instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post.image.name)
         return redirect('posts:post_detail', post_id=post_id)
     return render(request, 'posts/create_post.html', {
         'post': post, 'form': form, 'is_edit': True
@@ -104,15 +168,13 @@ def post_edit(request, post_id):
 
 @login_required
 def follow_index(request):
-    """получаем посты в которых author связан через модель Follows
-    текущим пользователем через request идем в Post, от туда через filter
-     в author, далее через select_related (following) в Follow, далее user.
-     Находим пользователя с заданным именем - для него ищем обьекты в
-     таблицы Follow которые на него ссылаются далее для всех найденых з
-     аписей в Follow ищутся связанные с ним авторы,
-     а далее все посты которые связаны с автором"""
-    posts = Post.objects.filter(author__following__user=request.user)
-    context = {'page_obj': paginate(posts, request)}
+    """Возвращает ленту подписок из материализованной таблицы Timeline,
+    которую заполняет posts.timeline при публикации и подписке"""
+    posts, ordering = timeline.feed(request.user)
+    context = {
+        'page_obj': attach_cards(paginate(
+            posts.for_feed(), request, cursor=True, ordering=ordering)),
+    }
     return render(request, 'posts/follow.html', context)
 
 
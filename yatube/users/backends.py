@@ -0,0 +1,41 @@
+"""Аутентификация с кэшированием пользователя.
+
+AuthenticationMiddleware на каждом запросе залогиненного пользователя
+достаёт его из базы по id из сессии. CachedModelBackend держит
+найденного пользователя в кэше USER_CACHE_TIMEOUT секунд; при любом
+сохранении или удалении пользователя (правка профиля, смена и сброс
+пароля, вход) запись сбрасывается, см. users.signals.
+
+ModelBackend остаётся в AUTHENTICATION_BACKENDS после него: сессии,
+созданные до его появления, ссылаются на ModelBackend.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+USER_KEY = 'users:user:{id}'
+
+
+def forget_user(user_id):
+    cache.delete(USER_KEY.format(id=user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None,
+                     **kwargs):
+        user = super().authenticate(
+            request, username=username, password=password, **kwargs)
+        if user is None:
+            # Следующий ModelBackend проверил бы тот же пароль ещё раз
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        key = USER_KEY.format(id=user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user
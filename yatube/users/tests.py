@@ -0,0 +1,87 @@
+from http import HTTPStatus
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .backends import USER_KEY
+
+User = get_user_model()
+
+
+class SessionCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='cached', password='old-secret-42')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_without_session(self):
+        """Анонимный запрос не читает и не создаёт сессию"""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        for query in context.captured_queries:
+            self.assertNotIn('django_session', query['sql'])
+
+    def test_logged_in_without_queries(self):
+        """Сессия и пользователь берутся из кэша"""
+        self.client.force_login(self.user)
+        self.client.get(reverse('about:author'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_profile_change_resets_cache(self):
+        """Правка профиля сбрасывает пользователя в кэше"""
+        self.client.force_login(self.user)
+        self.client.get(reverse('about:author'))
+        self.assertIsNotNone(cache.get(USER_KEY.format(id=self.user.pk)))
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Новое'
+        user.save()
+        self.assertIsNone(cache.get(USER_KEY.format(id=self.user.pk)))
+        response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'].first_name, 'Новое')
+
+    def test_password_change_logs_out_other_sessions(self):
+        """После смены пароля прежние сессии недействительны"""
+        other = self.client_class()
+        other.force_login(self.user)
+        other.get(reverse('about:author'))
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-secret-42',
+            'new_password1': 'new-secret-42',
+            'new_password2': 'new-secret-42',
+        })
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(
+            self.client.get(reverse('posts:post_create')).status_code,
+            HTTPStatus.OK)
+        self.assertEqual(
+            other.get(reverse('posts:post_create')).status_code,
+            HTTPStatus.FOUND)
+
+    def test_old_backend_sessions_resolve(self):
+        """Сессии, созданные с ModelBackend, остаются действительными"""
+        self.client.force_login(
+            self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('about:author'))
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_wrong_password_checked_once(self):
+        """Неверный пароль проверяется одним бэкендом"""
+        with mock.patch('django.contrib.auth.base_user.check_password',
+                        return_value=False) as check:
+            self.assertFalse(self.client.login(
+                username='cached', password='wrong'))
+        self.assertEqual(check.call_count, 1)
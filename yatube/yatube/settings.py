@@ -28,6 +28,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Включается настройкой REQUEST_PROFILING, см. core.profiling
+    'core.profiling.ProfilingMiddleware',
+    'core.metrics.MetricsMiddleware',
+    # До сессий: их запись тоже закрепляет пользователя за основной базой
+    'core.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,10 +41,49 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+# Профилирование запросов: заголовок Server-Timing и сводка по
+# представлениям на /_debug/profiling/ для персонала. SQL, повторённый
+# за один ответ столько раз, попадает в лог как вероятный N+1.
+REQUEST_PROFILING = False
+REQUEST_PROFILING_DUPLICATES = 3
+
+# Метрики Prometheus на /metrics, см. core.metrics. Включаются
+# переменной окружения METRICS_ENABLED=1 и отдаются только адресам из
+# METRICS_ALLOWED_IPS (за обратным прокси — адрес самого прокси, так
+# что закройте /metrics и на нём). Под несколькими процессами
+# WSGI-сервера укажите общий каталог METRICS_DIR: процессы сбрасывают
+# туда свои снимки не чаще раза в METRICS_FLUSH_INTERVAL с.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED') == '1'
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_DIR = ''
+METRICS_FLUSH_INTERVAL = 5
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, "static_files")
 
+# Лента подписок: посты авторов, у которых подписчиков больше этого
+# порога, не раскладываются по лентам, а подмешиваются при чтении.
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Число потоков, в которых строятся варианты картинок постов
+THUMBNAIL_WORKERS = 2
+# Ширины вариантов картинки для srcset и их форматы в порядке
+# предпочтения; форматы, которые не умеет Pillow, пропускаются.
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_FORMATS = ('avif', 'webp', 'jpeg')
+# Ограничения загружаемых картинок: размер файла, число пикселей и
+# длина большей стороны, до которой уменьшаются крупные снимки.
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 2560
+# Первый обработчик проверяет ограничения по мере чтения файла
+FILE_UPLOAD_HANDLERS = [
+    'posts.uploads.BoundedImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -50,12 +94,22 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
+# Без DEBUG шаблоны разбираются один раз на процесс (кэширующий
+# загрузчик) и заранее, при старте WSGI-приложения, см. core.precompile
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -69,12 +123,82 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# База данных задаётся переменными окружения; без них — SQLite в BASE_DIR.
+# Для PostgreSQL: DB_ENGINE=django.db.backends.postgresql, DB_NAME,
+# DB_USER, DB_PASSWORD, DB_HOST, DB_PORT. DB_CONN_MAX_AGE — сколько секунд
+# держать постоянное соединение между запросами (0 — закрывать после
+# каждого); пула соединений здесь нет. Если перед базой стоит PgBouncer в
+# режиме transaction, DB_POOLER=pgbouncer отключает серверные курсоры,
+# которые он не пропускает.
+DB_ENGINE = os.getenv('DB_ENGINE', 'core.backends.sqlite3')
+SQLITE = DB_ENGINE.endswith('.sqlite3')
+
+
+def database(host):
+    return {
+        'ENGINE': DB_ENGINE,
+        'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'USER': os.getenv('DB_USER', ''),
+        'PASSWORD': os.getenv('DB_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.getenv('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0 if SQLITE else 60)),
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_POOLER') == 'pgbouncer',
     }
+
+
+DATABASES = {'default': database(os.getenv('DB_HOST', ''))}
+# Реплики для чтения лент: DB_REPLICA_HOSTS=host1,host2, остальные
+# параметры как у основной базы. В тестах реплики смотрят в тестовую
+# основную базу. У SQLite реплик не бывает.
+REPLICA_HOSTS = [host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',')
+                 if host]
+for number, host in enumerate(REPLICA_HOSTS, 1):
+    DATABASES[f'replica_{number}'] = {
+        **database(host), 'TEST': {'MIRROR': 'default'}}
+# Алиасы, с которых читаются ленты (см. core.replicas); пусто — всё
+# читается с основной базы
+DATABASE_REPLICAS = [f'replica_{number}'
+                     for number in range(1, len(REPLICA_HOSTS) + 1)]
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Представления, которым можно читать с реплики
+REPLICA_READ_VIEWS = (
+    'posts:index', 'posts:group_list', 'posts:profile', 'posts:follow_index')
+# Сколько секунд после своей записи пользователь читает с основной базы:
+# столько с запасом длится отставание реплик
+REPLICA_PIN_SECONDS = 10
+
+# Прагмы каждого соединения с SQLite, см. core.backends.sqlite3.
+# busy_timeout (мс) идёт первым: ожидание нужно уже для переключения
+# журнала.
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательный размер — в КиБ, а не в страницах
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
 }
+# Как начинаются транзакции: IMMEDIATE сразу берёт блокировку записи,
+# DEFERRED (поведение SQLite по умолчанию) — только при первой записи
+SQLITE_TRANSACTION_MODE = 'IMMEDIATE'
+
+# Бэкенд поиска по постам, см. posts.search; FTS5 есть только у SQLite
+POSTS_SEARCH_BACKEND = ('posts.search.SqliteFtsBackend' if SQLITE
+                        else 'posts.search.SimpleSearchBackend')
+
+# Сессии читаются из кэша и пишутся в него и в базу. Анонимный запрос без
+# cookie сессии к ним не обращается. В режиме CACHE_MODE=local у каждого
+# процесса свой кэш, и выход из аккаунта другие процессы увидят не сразу.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Пользователь из сессии берётся из кэша, см. users.backends.
+# ModelBackend нужен сессиям, созданным до CachedModelBackend.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_TIMEOUT = 60 * 15
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -104,9 +228,44 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-# Добавляем кэширование
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Кэш выбирается переменной CACHE_MODE:
+# - local — свой LocMemCache у каждого процесса (для разработки);
+# - shared — общий кэш всех процессов WSGI-сервера: по умолчанию файлы в
+#   CACHE_LOCATION (с атомарным add, см. core.cache), бэкенд меняется
+#   через CACHE_BACKEND (memcached и т. п.);
+# - tiered — общий кэш и перед ним небольшой LRU в памяти процесса для
+#   неизменяемых ключей, см. core.cache.
+CACHE_MODE = os.getenv('CACHE_MODE', 'local' if DEBUG else 'tiered')
+SHARED_CACHE = {
+    'BACKEND': os.getenv(
+        'CACHE_BACKEND',
+        'core.cache.AtomicFileBasedCache'),
+    'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    'OPTIONS': {'MAX_ENTRIES': 10000},
 }
+if CACHE_MODE == 'local':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+elif CACHE_MODE == 'shared':
+    CACHES = {'default': SHARED_CACHE}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                # Карточки, страницы конкретного поколения и страницы
+                # для анонимов по ETag не меняются
+                'LOCAL_PREFIXES': ('posts:card:', 'posts:rendered:',
+                                   'posts:anonymous:'),
+                'LOCAL_MAX_ENTRIES': 500,
+                'LOCAL_TIMEOUT': 60,
+                # Отрендеренные страницы крупнее, сжимаются только они
+                'COMPRESS_MIN_BYTES': 16 * 1024,
+            },
+        },
+        'shared': SHARED_CACHE,
+    }
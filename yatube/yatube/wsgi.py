@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Шаблоны компилируются до первого запроса; с --preload у gunicorn
+# прогретый кэш достаётся всем воркерам
+from core.precompile import warm  # noqa: E402
+
+warm()